@@ -10,15 +10,28 @@ DOSBox configuration file generator.
 import argparse
 import configparser
 import hashlib
+import io
+import json
 import os
 import re
+import time
 
 import cuescanner
 import midi
+import toolbox
+import xdg
 
 from log import log, log_err, print_err
 from settings import SETTINGS as settings
-from winpathlib import to_posix_path
+from tracing import traced
+from winpathlib import RACY_MTIME_NS, resolve_many, to_posix_path
+
+AUTO_CONF_HEADER = """
+# Generated by Boxtron
+# This file is re-created whenever the environment changes
+# Environment fingerprint: {fingerprint}
+
+""".lstrip()
 
 COMMENT_SECTION = """
 # Generated by Boxtron
@@ -34,9 +47,14 @@ fullresolution={resolution}
 output=opengl
 autolock=false
 waitonerror=true
-
+{host_rate}
 """.lstrip()
 
+# Refresh rate of the display, used by DOSBox Staging for frame pacing
+# (other DOSBox versions ignore unknown options).
+#
+HOST_RATE_OPTION = 'host_rate={:.3f}\n'
+
 SDL_SECTION_2 = """
 [sdl]
 # fullscreen=true
@@ -121,9 +139,18 @@ MIDI_INFO_NA = """
         Music: No MIDI synthesiser found
 """.lstrip('\n')
 
+# Parsed .conf files are cached in this file in user's cache dir:
+CONF_CACHE_FILE = 'conf_cache.json'
+
+CONF_CACHE_MAX_ENTRIES = 256
+
 
 class DosboxConfigParser(configparser.ConfigParser):
-    """Specialisation of ConfigParser for DOSBox format."""
+    """Specialisation of ConfigParser for DOSBox format.
+
+    Sections and raw lines of autoexec section are parsed in a single pass
+    over the lines of a .conf file.
+    """
 
     # pylint: disable=too-many-ancestors
 
@@ -145,19 +172,40 @@ class DosboxConfigParser(configparser.ConfigParser):
 
         assert filenames.__class__ is str
 
-        # first pass to read everything except autoexec section
-        super().read(filenames, encoding)
-
-        # second pass to simply read lines in autoexec without standing on
-        # our heads and modifying ConfigParser internals:
         with open(filenames, 'r', encoding=encoding) as txt:
-            in_section = False
-            for line in txt:
-                if in_section:
-                    self.autoexec_lines.append(line.rstrip())
-                    continue
-                if line.strip().startswith('[autoexec]'):
-                    in_section = True
+            self.read_file(txt, filenames)
+
+    def read_file(self, f, source=None):
+        """Parse a .conf file from an iterable yielding lines.
+
+        Unlike ConfigParser, lines before the first section header are
+        ignored (just like DOSBox does) and all lines following autoexec
+        section header are kept verbatim.
+        """
+        section = None
+        in_autoexec = False
+        for line in f:
+            if in_autoexec:
+                self.autoexec_lines.append(line.rstrip())
+            value = line.strip()
+            if not value or value[0] in '#;':
+                continue
+            match = self.SECTCRE.match(value)
+            if match:
+                section = match.group('header')
+                if section == 'autoexec':
+                    in_autoexec = True
+                if section != self.default_section and \
+                   not self.has_section(section):
+                    self.add_section(section)
+                continue
+            if section in (None, 'autoexec'):
+                continue
+            option, delimiter, opt_value = value.partition('=')
+            if delimiter:
+                self.set(section, option.rstrip(), opt_value.lstrip())
+            else:
+                self.set(section, option, None)
 
     def get_autoexec(self):
         """Return list of lines in autoexec section."""
@@ -273,28 +321,123 @@ def uniq_conf_name_salted(pfx, game_id, args, salt):
     return '{0}_{1}_{2}.conf'.format(pfx, game_id, uid)
 
 
-def parse_dosbox_config(conf_file):
-    """Parse DOSBox configuration file."""
-    assert conf_file
-    config = DosboxConfigParser()
-    encoding = 'utf-8'
-    try:
-        # Try simply reading a .conf file, assuming it's utf-8 encoded,
-        # as any modern text editor will likely create utf-8 file by
-        # default.
-        #
-        config.read(conf_file)
+def decode_conf_bytes(data):
+    """Detect encoding of a .conf file content and decode it.
+
+    Return a tuple: decoded text and the name of detected encoding.
+    """
+    # Most .conf files are plain ASCII, which is also valid utf-8:
+    if data.isascii():
+        return data.decode('ascii'), 'utf-8'
 
+    # Any modern text editor will likely create utf-8 file by default,
+    # and random bytes are very unlikely to form valid utf-8 sequences.
+    try:
+        return data.decode('utf-8'), 'utf-8'
     except UnicodeDecodeError:
-        # Failed decoding from utf-8 means, that likely there are some
-        # graphical glyphs in autoexec section of a .conf file.
-        #
-        # This seems to be a common case for .conf files distributed
-        # with GOG games. Just retry with specific old encoding.
-        #
-        encoding = 'cp1250'
-        config.read(conf_file, encoding=encoding)
+        pass
+
+    # Otherwise it's likely a .conf file distributed with a GOG game,
+    # often with graphical glyphs (box drawing characters from code page
+    # 437) used in echo commands in autoexec section.  These glyphs
+    # are in range 0xB0-0xDF; text in Central European languages uses
+    # mostly lowercase letters, above 0xDF in cp1250.
+    #
+    # cp437 maps all 256 bytes, so it's also a safe choice when cp1250
+    # can't decode the file.
+    #
+    high_bytes = [b for b in data if b >= 0x80]
+    box_drawing = [b for b in high_bytes if 0xB0 <= b <= 0xDF]
+    if 2 * len(box_drawing) <= len(high_bytes):
+        try:
+            return data.decode('cp1250'), 'cp1250'
+        except UnicodeDecodeError:
+            pass
+    return data.decode('cp437'), 'cp437'
+
+
+class ConfCache:
+    """Cache of parsed .conf files, stored in user's cache dir.
+
+    Entries are keyed by real path of a .conf file and validated by size,
+    mtime and inode number of the file.
+    """
+
+    def __init__(self):
+        self.entries = None
+        self.modified = False
+
+    def __load__(self):
+        self.entries = {}
+        try:
+            with open(xdg.cache_path(CONF_CACHE_FILE), 'r') as cache:
+                self.entries = json.load(cache).get('entries', {})
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def get(self, path, key):
+        """Return cached (config, encoding) or None."""
+        if self.entries is None:
+            self.__load__()
+        entry = self.entries.get(path)
+        if not entry or entry.get('key') != key:
+            return None
+        config = DosboxConfigParser()
+        config.read_dict(entry['sections'])
+        config.autoexec_lines = list(entry['autoexec'])
+        return config, entry['encoding']
+
+    def put(self, path, key, config, encoding):
+        """Store parsed config in the cache."""
+        if self.entries is None:
+            self.__load__()
+        self.entries.pop(path, None)
+        while len(self.entries) >= CONF_CACHE_MAX_ENTRIES:
+            del self.entries[next(iter(self.entries))]
+        self.entries[path] = {
+            'key': key,
+            'encoding': encoding,
+            'sections': {
+                name: dict(config[name])
+                for name in config.sections()
+            },
+            'autoexec': config.get_autoexec(),
+        }
+        self.modified = True
+
+    def save(self):
+        """Write the cache file, if anything changed."""
+        if not self.modified:
+            return
+        data = json.dumps({'entries': self.entries})
+        if toolbox.write_atomically(xdg.cache_path(CONF_CACHE_FILE), data):
+            self.modified = False
+
+
+CONF_CACHE = ConfCache()
 
+
+def parse_dosbox_config(conf_file):
+    """Parse DOSBox configuration file.
+
+    Files, that did not change since the last time they were parsed,
+    are read from the cache instead.
+    """
+    assert conf_file
+    real_path = os.path.realpath(conf_file)
+    stat = os.stat(real_path)
+    key = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+    cached = CONF_CACHE.get(real_path, key)
+    if cached:
+        return cached
+    with open(real_path, 'rb') as conf:
+        text, encoding = decode_conf_bytes(conf.read())
+    config = DosboxConfigParser()
+    config.read_string(text, conf_file)
+    # File modified within the same timestamp tick as it was read can't
+    # be told apart from the cached version.
+    if time.time_ns() - stat.st_mtime_ns > RACY_MTIME_NS:
+        CONF_CACHE.put(real_path, key, config, encoding)
     return config, encoding
 
 
@@ -336,13 +479,19 @@ def to_linux_autoexec(autoexec):
     cmd = r'@? *(mount|imgmount) +([a-z]):? +(.*)?'
     mount_cmd = re.compile(cmd, re.IGNORECASE)
     change_drv = re.compile(r'@? *([a-z]:)\\? *$', re.IGNORECASE)
-    for line in autoexec:
-        match = mount_cmd.match(line)
+    lines = list(autoexec)
+    mounts = [mount_cmd.match(line) for line in lines]
+    # Resolve paths used by all mount commands in one go:
+    posix_paths = resolve_many([
+        path for match in mounts if match
+        for path in parse_mount_params(match.group(3))[0]
+    ])
+    for line, match in zip(lines, mounts):
         if match:
             cmd = match.group(1).lower()
             drive = match.group(2).upper()
             paths, rest = parse_mount_params(match.group(3))
-            paths = map(to_posix_path, paths)
+            paths = map(posix_paths.get, paths)
             if cmd == 'imgmount':
                 paths = map(convert_cue_file, paths)
             new_paths = ' '.join('"{0}"'.format(p) for p in paths)
@@ -384,6 +533,7 @@ def parse_dosbox_arguments(args):
     return args
 
 
+@traced
 def create_dosbox_configuration(dosbox_args, tweak_conf):
     """Interpret DOSBox configuration."""
     args = parse_dosbox_arguments(dosbox_args)
@@ -396,9 +546,11 @@ def create_dosbox_configuration(dosbox_args, tweak_conf):
                                noautoexec=args.noautoexec,
                                exit_after_exe=args.exit,
                                tweak_conf=tweak_conf)
+    CONF_CACHE.save()
     return conf
 
 
+@traced
 def create_user_conf_file(name, conf, dosbox_args):
     """Create DOSBox configuration file for user.
 
@@ -439,10 +591,12 @@ def create_user_conf_file(name, conf, dosbox_args):
 def write_sdl_section(file):
     """Write sdl section."""
     if settings.finalized:
+        rate = settings.get_dosbox_host_rate()
         file.write(
             SDL_SECTION_1.format(
                 fullscreen=settings.get_dosbox_fullscreen_on(),
-                resolution=settings.get_dosbox_fullresolution()))
+                resolution=settings.get_dosbox_fullresolution(),
+                host_rate=HOST_RATE_OPTION.format(rate) if rate else ''))
 
 
 def write_render_section(conf, file):
@@ -474,9 +628,12 @@ def write_sblaster_section(conf, file):
     file.write(SBLASTER_SECTION.format(base=base, irq=irq, dma=dma, hdma=hdma))
 
 
-def write_midi_section(file):
-    """Write midi section."""
-    mport = midi.find_midi_port()
+def write_midi_section(file, mport=None):
+    """Write midi section.
+
+    Without known MIDI port, sequencer clients are searched for one.
+    """
+    mport = mport or midi.find_midi_port()
     if mport:
         log('Detected', mport.name, 'on', mport.addr)
         print_err(MIDI_INFO)
@@ -494,21 +651,39 @@ def write_dos_section(conf, file):
         file.write(DOS_SECTION.format(xms=dos_xms, ems=dos_ems, umb=dos_umb))
 
 
-def create_auto_conf_file(conf):
+@traced
+def create_auto_conf_file(conf, midi_port=None):
     """Create DOSBox configuration file based on environment.
 
     Different sections are either hard-coded or generated based on
     user environment (used midi port, current screen resolution, etc.).
+    midi_port is the port of synthesizer detected or started earlier.
+
+    File is re-written only when the environment changed since the
+    last run.
     """
     name = 'boxtron_auto.conf'
-    with open(name, 'w') as auto:
-        auto.write('# Generated by Boxtron\n')
-        auto.write('# This file is re-created on every run\n\n')
-        write_sdl_section(auto)
-        write_render_section(conf, auto)
-        auto.write(CPU_SECTION)
-        write_mixer_section(conf, auto)
-        write_sblaster_section(conf, auto)
-        write_midi_section(auto)
-        write_dos_section(conf, auto)
+    auto = io.StringIO()
+    write_sdl_section(auto)
+    write_render_section(conf, auto)
+    auto.write(CPU_SECTION)
+    write_mixer_section(conf, auto)
+    write_sblaster_section(conf, auto)
+    write_midi_section(auto, midi_port)
+    write_dos_section(conf, auto)
+    sections = auto.getvalue()
+    fingerprint = hashlib.sha1(sections.encode('utf-8')).hexdigest()[:12]
+    content = AUTO_CONF_HEADER.format(fingerprint=fingerprint) + sections
+    try:
+        with open(name, 'r') as old_auto:
+            if old_auto.read() == content:
+                log('environment fingerprint:', fingerprint, '(unchanged)')
+                return name
+    except (OSError, UnicodeDecodeError):
+        pass
+    log('environment fingerprint:', fingerprint)
+    tmp_name = name + '.tmp'
+    with open(tmp_name, 'w') as new_auto:
+        new_auto.write(content)
+    os.replace(tmp_name, name)
     return name
@@ -88,13 +88,6 @@ def rm_prefix(pfx, txt):
     return txt
 
 
-def fix_relative_path(pfx_win, pfx_lin, file_path):
-    """Convert a path relative to a different directory"""
-    win_path = pfx_win + file_path
-    linux_path = winpathlib.to_posix_path(win_path)
-    return rm_prefix(pfx_lin, linux_path)
-
-
 def fix_index_number(num):
     """Clamp index number in cue file to the only valid values."""
     return '00' if num in ('0', '00') else '01'
@@ -108,37 +101,47 @@ def dir_prefixes(path):
     return pfx_win, pfx_lin
 
 
+def find_file_entries(lines):
+    """Return dict mapping line numbers to (indent, path, type) tuples"""
+    file_entry_1 = re.compile(r'( *)FILE +"([^"]+)" +(.*)')
+    file_entry_2 = re.compile(r'( *)FILE +([^ ]+) +(.*)')
+    entries = {}
+    for num, line in enumerate(lines):
+        match = file_entry_1.match(line) or file_entry_2.match(line)
+        if match:
+            entries[num] = match.groups()
+    return entries
+
+
 def create_fixed_cue_file(cue_path, new_file):
     """Filter content of .cue file and save as fixed file"""
 
-    file_entry_1 = re.compile(r'( *)FILE +"([^"]+)" +(.*)')
-    file_entry_2 = re.compile(r'( *)FILE +([^ ]+) +(.*)')
     index_entry = re.compile(r'( *)INDEX +(\d+) +(.*)')
     pfx_win, pfx_lin = dir_prefixes(cue_path)
     new_file_path = os.path.join(pfx_lin, new_file)
+    with open(cue_path, 'r') as cue_file:
+        lines = cue_file.readlines()
+    file_entries = find_file_entries(lines)
+    posix_paths = winpathlib.resolve_many(
+        [pfx_win + path for _, path, _ in file_entries.values()])
 
     def fix_file_entry(indent, path, file_type):
-        return '{}FILE "{}" {}\n'.format(
-            indent, fix_relative_path(pfx_win, pfx_lin, path), file_type)
-
-    def fix_index_entry(indent, num, time_pos):
+        linux_path = rm_prefix(pfx_lin, posix_paths[pfx_win + path])
+        return '{}FILE "{}" {}\n'.format(indent, linux_path, file_type)
+
+    def fix_index_entry(line):
+        match = index_entry.match(line)
+        if not match:
+            return line
+        indent, num, time_pos = match.groups()
         return '{}INDEX {} {}\n'.format(indent, fix_index_number(num),
                                         time_pos)
 
-    with open(cue_path, 'r') as cue_file, open(new_file_path, 'w') as out_file:
-        for line in cue_file:
-            match = file_entry_1.match(line) or file_entry_2.match(line)
-            if match:
-                line = fix_file_entry(match.group(1), match.group(2),
-                                      match.group(3))
-                out_file.write(line)
-                continue
-            match = index_entry.match(line)
-            if match:
-                line = fix_index_entry(match.group(1), match.group(2),
-                                       match.group(3))
-                out_file.write(line)
-                continue
-            out_file.write(line)
+    with open(new_file_path, 'w') as out_file:
+        for num, line in enumerate(lines):
+            if num in file_entries:
+                out_file.write(fix_file_entry(*file_entries[num]))
+            else:
+                out_file.write(fix_index_entry(line))
 
     return new_file_path
@@ -0,0 +1,141 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# Copyright (C) 2019-2021  Patryk Obara <patryk.obara@gmail.com>
+
+"""
+Screen layout, cached between launches.
+
+Asking X server about screens means loading libX11 and libXinerama and
+talking to the server; screen layout rarely changes, so the result is
+kept in the runtime dir and discarded when state of display connectors
+(published by DRM drivers in sysfs) changes.
+
+Without X server (or without Xinerama), screens are described using
+connector state alone.
+"""
+
+import collections
+import json
+import os
+import re
+import time
+
+import xdg
+
+from log import log
+from toolbox import write_atomically
+from tracing import traced
+
+DRM_SYSFS = '/sys/class/drm'
+
+SCREENS_CACHE_FILE = 'screens.json'
+
+# Resolution changed without (dis)connecting a monitor is not visible
+# in sysfs; limit how long such change can go unnoticed.
+#
+SCREENS_CACHE_MAX_AGE = 3600
+
+# Same as xlib.ScreenInfo, but available without loading X libraries.
+#
+ScreenInfo = collections.namedtuple('ScreenInfo',
+                                    'number width height x y refresh primary')
+
+
+def drm_signature(drm_sysfs=DRM_SYSFS):
+    """Return list describing state of all display connectors.
+
+    List is empty if DRM sysfs interface is not available.
+    """
+    try:
+        names = sorted(os.listdir(drm_sysfs))
+    except OSError:
+        return []
+    signature = []
+    for name in names:
+        # Connectors are named like card0-HDMI-A-1, cards simply card0.
+        if not name.startswith('card') or '-' not in name:
+            continue
+        state = [name]
+        for attr in ('status', 'enabled', 'modes'):
+            try:
+                with open(os.path.join(drm_sysfs, name, attr), 'r') as file:
+                    state.append(file.read().strip())
+            except OSError:
+                state.append(None)
+        signature.append(state)
+    return signature
+
+
+def drm_screens(signature):
+    """Return dict of ScreenInfo objects describing connected displays.
+
+    signature is a list returned by drm_signature.  Sysfs does not expose
+    current mode nor placement of displays, so the preferred (first
+    listed) mode is used and displays are placed left to right.
+    """
+    screens = {}
+    x_org = 0
+    for _, status, enabled, modes in signature:
+        if status != 'connected' or enabled == 'disabled':
+            continue
+        match = re.match(r'(\d+)x(\d+)', modes or '')
+        if not match:
+            continue
+        width, height = int(match.group(1)), int(match.group(2))
+        number = len(screens)
+        screens[str(number)] = ScreenInfo(number, width, height, x_org, 0,
+                                          None, False)
+        x_org += width
+    return screens
+
+
+def load_cached_screens(key):
+    """Return screens found previously for the same key or None."""
+    name = xdg.runtime_path(SCREENS_CACHE_FILE)
+    try:
+        if time.time() - os.stat(name).st_mtime > SCREENS_CACHE_MAX_AGE:
+            return None
+        with open(name, 'r') as cache:
+            cached = json.load(cache)
+        if not isinstance(cached, dict) or cached.get('key') != key:
+            return None
+        return {
+            number: ScreenInfo(*info)
+            for number, info in cached['screens'].items()
+        }
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def save_cached_screens(key, screens):
+    """Remember screens found for a key."""
+    cached = {'key': key, 'screens': screens}
+    write_atomically(xdg.runtime_path(SCREENS_CACHE_FILE), json.dumps(cached))
+
+
+@traced
+def query_screens():
+    """Return dict of ScreenInfo objects describing available screens."""
+    key = {
+        'display': os.environ.get('DISPLAY', ''),
+        'drm': drm_signature(DRM_SYSFS)
+    }
+    if not key['display']:
+        log('DISPLAY not set, using DRM connectors')
+        return drm_screens(key['drm'])
+    if key['drm']:
+        screens = load_cached_screens(key)
+        if screens is not None:
+            log('using cached screen layout')
+            return screens
+    import xlib  # pylint: disable=import-outside-toplevel
+    screens = {
+        number: ScreenInfo(*info)
+        for number, info in xlib.query_screens().items()
+    }
+    if not screens:
+        log('no screens reported by X server, using DRM connectors')
+        return drm_screens(key['drm'])
+    # Without connector state there's no way to notice a change.
+    if key['drm']:
+        save_cached_screens(key, screens)
+    return screens
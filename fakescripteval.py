@@ -8,11 +8,10 @@ Fake iscriptevaluator.exe
 import os
 import re
 import subprocess
-import urllib.request
 import shutil
 
+import installstep
 import toolbox
-import tweaks
 import xdg
 
 from log import log
@@ -40,34 +39,20 @@ def download_item(i, num, name, desc):
     cache_file = xdg.cached_file(name)
     if os.path.isfile(cache_file):
         return
+    import urllib.request  # pylint: disable=import-outside-toplevel
     log('downloading', url, 'to', cache_file)
-    msg = '{}/{}: {}'.format(i, num, txt)
-    # TODO use runtime dir instead of cache here
-    with open(xdg.cached_file('desc.txt'), 'w') as msg_file:
-        msg_file.write(msg)
+    installstep.set_current_step('{}/{}: {}'.format(i, num, txt))
     with urllib.request.urlopen(url) as resp, open(cache_file, 'wb') as out:
         shutil.copyfileobj(resp, out)
 
 
-def print_current_step():
-    """Print description of current 'installation' step."""
-    # leaving message in a file is not the most sophisticated solution
-    # works for now; maybe replace with FIFO later, if needed
-    msg_path = xdg.cached_file('desc.txt')
-    if not os.path.isfile(msg_path):
-        return
-    with open(msg_path, 'r') as msg_file:
-        msg = msg_file.read().strip()
-        print(msg, end='')
-
-
 def iscriptevaluator(args):
     """Pretend to be iscriptevaluator.exe program."""
     assert args
     last_arg = args[-1]
 
     if '--get-current-step' in args:
-        print_current_step()
+        installstep.print_current_step()
         return 0
 
     # SteamAppId is 0 during installation
@@ -77,6 +62,7 @@ def iscriptevaluator(args):
     if match:
         steam_app_id = match.group(1)
 
+    import tweaks  # pylint: disable=import-outside-toplevel
     game_id = 'steam:' + steam_app_id
     if not tweaks.download_tweak_needed(game_id):
         return 0
@@ -89,10 +75,7 @@ def iscriptevaluator(args):
         for name, desc in download_links.items():
             download_item(i, num, name, desc)
             i += 1
-    try:
-        os.remove(xdg.cached_file('desc.txt'))
-    except FileNotFoundError:
-        pass
+    installstep.clear_current_step()
 
     status = 0
     return status
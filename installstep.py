@@ -0,0 +1,47 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# Copyright (C) 2019-2021  Patryk Obara <patryk.obara@gmail.com>
+
+"""
+Progress of fake installation scripts.
+
+Steam polls for the current installation step very often (starting
+a new process every time), so this module must stay cheap to import.
+"""
+
+import os
+
+import xdg
+
+STEP_FILE = 'install_step.txt'
+
+
+def is_current_step_query(args):
+    """Test if command line is Steam asking for the current step."""
+    cmd_line = [arg for arg in args if arg not in ('^', '--wait-before-run')]
+    return bool(cmd_line) and \
+        os.path.basename(cmd_line[0]) == 'iscriptevaluator.exe' and \
+        '--get-current-step' in cmd_line
+
+
+def set_current_step(msg):
+    """Publish description of current 'installation' step."""
+    import toolbox  # pylint: disable=import-outside-toplevel
+    toolbox.write_atomically(xdg.runtime_path(STEP_FILE), msg)
+
+
+def clear_current_step():
+    """Remove description of 'installation' step."""
+    try:
+        os.remove(xdg.runtime_path(STEP_FILE))
+    except OSError:
+        pass
+
+
+def print_current_step():
+    """Print description of current 'installation' step."""
+    try:
+        with open(xdg.runtime_path(STEP_FILE), 'r') as step_file:
+            msg = step_file.read().strip()
+    except OSError:
+        return
+    print(msg, end='')
@@ -0,0 +1,122 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# Copyright (C) 2019-2021  Patryk Obara <patryk.obara@gmail.com>
+
+"""
+Cache of decisions made while launching a game.
+
+Interpreting the command line sent by Steam involves looking for .conf
+files, parsing batch files, Sierra Launcher configuration, etc.  Launch
+plan records the outcome of all these steps (final working directory and
+arguments for DOSBox configuration generator) after a successful launch,
+so the next launch can skip them.
+"""
+
+import json
+import os
+
+import confgen
+import toolbox
+import version
+import xdg
+
+from log import log
+from winpathlib import to_posix_path
+
+
+def mtime_ns(path):
+    """Return mtime of a file or None if it does not exist."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class LaunchPlan:
+    """Launch plan for a single game."""
+
+    def __init__(self):
+        self.file_name = None
+        self.key = None
+        self.cwd = None
+        self.dosbox_args = None
+        self.inputs = {}
+        self.restored = False
+
+    def begin(self, game_install_id, cmd_line):
+        """Start a new plan for command line used to launch a game."""
+        self.file_name = 'launch_plan_{}.json'.format(game_install_id)
+        self.key = {
+            'version': version.VERSION,
+            'cwd': os.getcwd(),
+            'cmd_line': cmd_line,
+            'run_exe': os.environ.get('BOXTRON_RUN_EXE'),
+        }
+        self.cwd = None
+        self.dosbox_args = None
+        self.inputs = {}
+        self.restored = False
+        if cmd_line:
+            self.add_input(cmd_line[0])
+
+    def add_input(self, path):
+        """Make the plan depend on a file."""
+        abs_path = os.path.abspath(path)
+        self.inputs[abs_path] = mtime_ns(abs_path)
+
+    def record(self, dosbox_args):
+        """Record arguments for DOSBox configuration generator.
+
+        Plan depends on all files referenced by these arguments.
+        """
+        self.cwd = os.getcwd()
+        self.dosbox_args = list(dosbox_args)
+        try:
+            args = confgen.parse_dosbox_arguments(dosbox_args)
+        except RuntimeError:
+            return
+        for win_path in (args.conf or []) + ([args.file] if args.file else []):
+            path = to_posix_path(win_path, strict=False)
+            if path:
+                self.add_input(path)
+
+    def restore(self):
+        """Load a plan recorded for the same command line.
+
+        Return True if the plan is still valid.
+        """
+        assert self.key
+        try:
+            with open(xdg.cache_path(self.file_name), 'r') as plan_file:
+                plan = json.load(plan_file)
+        except (OSError, ValueError):
+            return False
+        if not isinstance(plan, dict) or plan.get('key') != self.key:
+            return False
+        inputs = plan.get('inputs', {})
+        for path, mtime in inputs.items():
+            if mtime_ns(path) != mtime:
+                log('launch plan outdated:', path, 'changed')
+                return False
+        if not os.path.isdir(plan.get('cwd', '')):
+            return False
+        self.cwd = plan['cwd']
+        self.dosbox_args = plan['dosbox_args']
+        self.inputs = inputs
+        self.restored = True
+        return True
+
+    def save(self):
+        """Store the plan, if anything was recorded."""
+        if self.restored or not self.dosbox_args:
+            return
+        plan = {
+            'key': self.key,
+            'cwd': self.cwd,
+            'dosbox_args': self.dosbox_args,
+            'inputs': self.inputs,
+        }
+        toolbox.write_atomically(xdg.cache_path(self.file_name),
+                                 json.dumps(plan))
+
+
+LAUNCH_PLAN = LaunchPlan()
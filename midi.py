@@ -7,6 +7,7 @@ Additional functionality for MIDI support.
 
 import atexit
 import collections
+import json
 import os
 import re
 import signal
@@ -14,9 +15,11 @@ import subprocess
 import time
 
 import toolbox
+import xdg
 
 from log import log, log_warn, log_err
 from settings import SETTINGS as settings
+from tracing import traced
 
 # casio:   tested with Casio CTK-4200
 # um-one:  tested with Roland's UM-ONE USB MIDI interface
@@ -26,129 +29,704 @@ KNOWN_HARDWARE = r'casio|um-one|ensoniq|mpu-401 uart'
 
 ALSA_SEQ_CLIENTS = '/proc/asound/seq/clients'
 
+# JACK server listens on a socket here (files left by a server that
+# crashed stay behind, so socket needs to accept a connection).
+#
+SHM_DIR = '/dev/shm'
+
+# Software synthesizer needs a moment to open its sequencer port; procfs
+# is checked again after this many seconds (doubled on each attempt).
+#
+SYNTH_POLL_INTERVAL = 0.01
+
+SYNTH_POLL_MAX_INTERVAL = 0.2
+
+# Seconds to wait for a stopped synthesizer to exit (and close its port).
+#
+SYNTH_STOP_TIMEOUT = 5.0
+
 MidiPort = collections.namedtuple('MidiPort', 'addr name desc space flags')
 
+CLIENT_PATTERN = re.compile(r'^ *Client +(\d+) *: "(.*)" \[(.*)\]')
+
+PORT_PATTERN = re.compile(r'^ *Port +(\d+) *: "(.*)" \((.{4})\)')
+
+CONNECTED_FROM_PATTERN = re.compile(r'^\s*Connected From:\s+(.*)')
+
+ADDR_PATTERN = re.compile(r'\d+:\d+')
+
+# Buffer sizes used for each latency target; 'high' means synthesiser
+# defaults.  Period size is in sample frames, TiMidity++ buffer is given
+# as 'fragments,log2(fragment size)'.
+#
+LatencyProfile = collections.namedtuple(
+    'LatencyProfile', 'period_size periods timidity_buffer pulse_latency_ms')
+
+LATENCY_PROFILES = {
+    'low': LatencyProfile(128, 2, '2,8', 10),
+    'medium': LatencyProfile(256, 2, '2,9', 20),
+    'high': None,
+}
+
+# Default mixer rate in DOSBox; avoids resampling by the audio server.
+#
+SYNTH_SAMPLE_RATE = 48000
+
+# Address of FluidSynth shell server and seconds to wait for its response
+# (loading a soundfont might take a while).
+#
+FLUIDSYNTH_SHELL_HOST = '127.0.0.1'
+
+FLUIDSYNTH_SHELL_TIMEOUT = 30.0
+
+MIDI_THROUGH = MidiPort('14:0', 'Midi Through', 'Midi Through Port-0',
+                        'Kernel', '?W??')
+
 
-# I would very much prefer to implement this function using ctypes and
+# I would very much prefer to implement this class using ctypes and
 # alsa-lib, but that lib does not expose memory allocation functions
 # as symbols (they are all macros), making it somewhat difficult to use
 # from Python.
 #
+class SequencerSnapshot:
+    """Sequencer ports and connections visible through ALSA procfs.
+
+    The file is parsed once, so all queries during a launch give
+    consistent answers; call refresh() after starting a new client.
+    """
+
+    def __init__(self, alsa_seq_clients=ALSA_SEQ_CLIENTS):
+        self.alsa_seq_clients = alsa_seq_clients
+        self.ports = []
+        self.connected_from = {}
+        self.refresh()
+
+    def refresh(self):
+        """Parse sequencer clients list again."""
+        ports = []
+        connected_from = {}
+        try:
+            with open(self.alsa_seq_clients) as clients:
+                lines = clients.readlines()
+        except FileNotFoundError:
+            lines = []
+        client, name, space = '', '', ''
+        for line in lines:
+            match = CLIENT_PATTERN.match(line)
+            if match:
+                client, name, space = match.groups()
+                continue
+            match = PORT_PATTERN.match(line)
+            if match:
+                port, desc, flags = match.groups()
+                ports.append(
+                    MidiPort('{}:{}'.format(client, port), name, desc, space,
+                             flags))
+                continue
+            match = CONNECTED_FROM_PATTERN.match(line)
+            if match and ports:
+                connected_from[ports[-1].addr] = \
+                    ADDR_PATTERN.findall(match.group(1))
+        self.ports = ports
+        self.connected_from = connected_from
+
+    def match_port_by_name(self, name_expr, ignored_ports=()):
+        """Return an input port, where client name matches expression.
+
+        Ports with addresses listed in ignored_ports are skipped.
+        """
+        client_name_pattern = re.compile(name_expr, re.IGNORECASE)
+        for port in self.ports:
+            if port.flags[1] != 'W' or port.addr in ignored_ports:
+                continue
+            if client_name_pattern.match(port.name):
+                return port
+        return None
+
+    def active_midi_through(self):
+        """Return 'Midi Through' port (14:0) if it's connected to something.
+
+        If this port is connected to anything, whatever the purpose is,
+        the user decided to pass through MIDI signal to some device -
+        hardware or software.
+
+        One possible use-case is to pass MIDI signal to software
+        synthesizer running under Wine, e.g. Roland Sound Canvas VA.
+        """
+        for sources in self.connected_from.values():
+            if MIDI_THROUGH.addr in sources:
+                return MIDI_THROUGH
+        return None
+
+    def find_midi_port(self, user_pref=None):
+        """Find open MIDI port to connect to."""
+        if user_pref:
+            return self.match_port_by_name(user_pref)
+        return self.match_port_by_name(KNOWN_HARDWARE) \
+            or self.match_port_by_name(r'timidity|fluid') \
+            or self.active_midi_through()
+
+
+SNAPSHOTS = {}
+
+
+def sequencer_snapshot(alsa_seq_clients=ALSA_SEQ_CLIENTS):
+    """Return SequencerSnapshot, parsing the file on the first use."""
+    snapshot = SNAPSHOTS.get(alsa_seq_clients)
+    if snapshot is None:
+        snapshot = SequencerSnapshot(alsa_seq_clients)
+        SNAPSHOTS[alsa_seq_clients] = snapshot
+    return snapshot
+
+
 def list_alsa_sequencer_ports(alsa_seq_clients=ALSA_SEQ_CLIENTS):
     """List all sequencer ports visible through ALSA procfs."""
-    try:
-        with open(alsa_seq_clients) as clients:
-            client_pattern = re.compile(r'^ *Client +(\d+) *: "(.*)" \[(.*)\]')
-            port_pattern = re.compile(r'^ *Port +(\d+) *: "(.*)" \((.{4})\)')
-            client, name, space, port, desc, flags = '', '', '', '', '', ''
-            for line in clients.readlines():
-                match = client_pattern.match(line)
-                if match:
-                    client = match.group(1)
-                    name = match.group(2)
-                    space = match.group(3)
-                    continue
-                match = port_pattern.match(line)
-                if match:
-                    port = match.group(1)
-                    desc = match.group(2)
-                    flags = match.group(3)
-                    yield MidiPort('{}:{}'.format(client, port), name, desc,
-                                   space, flags)
-    except FileNotFoundError:
-        pass  # we want simply empty generator
+    return iter(sequencer_snapshot(alsa_seq_clients).ports)
 
 
 def active_midi_through(alsa_seq_clients=ALSA_SEQ_CLIENTS):
-    """Return 'Midi Through' port (14:0) if it's connected to something.
-
-    If this port is connected to anything, whatever the purpose is, the user
-    decided to pass through MIDI signal to some device - hardware or software.
-
-    One possible use-case is to pass MIDI signal to software synthesizer
-    running under Wine, e.g. Roland Sound Canvas VA.
-    """
-    try:
-        with open(alsa_seq_clients) as clients:
-            connected_from_pattern = re.compile(r'^\s*Connected From:\s+14:0')
-            for line in clients.readlines():
-                match = connected_from_pattern.match(line)
-                if match:
-                    port = MidiPort('14:0', 'Midi Through',
-                                    'Midi Through Port-0', 'Kernel', '?W??')
-                    return port
-    except FileNotFoundError:
-        pass
-    return None
+    """Return 'Midi Through' port (14:0) if it's connected to something."""
+    return sequencer_snapshot(alsa_seq_clients).active_midi_through()
 
 
 def find_midi_port(seq_clients=ALSA_SEQ_CLIENTS):
     """Find open MIDI port to connect to."""
     user_pref = settings.get_midi_sequencer()
-    return match_port_by_name(user_pref, seq_clients) if user_pref else None \
-        or match_port_by_name(KNOWN_HARDWARE, seq_clients) \
-        or match_port_by_name(r'timidity|fluid', seq_clients) \
-        or active_midi_through(seq_clients)
+    return sequencer_snapshot(seq_clients).find_midi_port(user_pref)
 
 
 def match_port_by_name(name_expr=None, seq_clients=ALSA_SEQ_CLIENTS):
     """Return an input port, where client name matches expression."""
-    client_name_pattern = re.compile(name_expr, re.IGNORECASE)
-    for port in list_alsa_sequencer_ports(seq_clients):
-        if port.flags[1] != 'W':
-            continue
-        match = client_name_pattern.match(port.name)
-        if match:
+    return sequencer_snapshot(seq_clients).match_port_by_name(name_expr)
+
+
+def wait_for_synth_port(proc,
+                        name_expr,
+                        timeout,
+                        seq_clients=ALSA_SEQ_CLIENTS,
+                        known_ports=()):
+    """Wait until software synthesizer opens its sequencer port.
+
+    Sequencer clients are checked with growing interval until a port of
+    a client matching name_expr shows up, the process exits or timeout
+    (in seconds) expires.  Ports listed in known_ports (opened before
+    the process started) belong to other clients and are ignored.
+    Return the port or None.
+    """
+    deadline = time.monotonic() + timeout
+    interval = SYNTH_POLL_INTERVAL
+    snapshot = sequencer_snapshot(seq_clients)
+    while True:
+        snapshot.refresh()
+        port = snapshot.match_port_by_name(name_expr, known_ports)
+        if port:
             return port
-    return None
+        if proc.poll() is not None:
+            log_err('MIDI client (pid: {0}) exited'.format(proc.pid))
+            return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            log_warn('MIDI client (pid: {0}) did not open a port '
+                     'in {1} seconds'.format(proc.pid, timeout))
+            return None
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, SYNTH_POLL_MAX_INTERVAL)
+
+
+def jack_server_running(shm_dir=SHM_DIR):
+    """Check if JACK server is accepting clients of this user."""
+    import socket  # pylint: disable=import-outside-toplevel
+    server = os.environ.get('JACK_DEFAULT_SERVER') or 'default'
+    name = 'jack_{0}_{1}_0'.format(server, os.getuid())
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(os.path.join(shm_dir, name))
+            return True
+        except OSError:
+            return False
 
 
-def start_timidity(sfont):
-    """Start TiMidity++ process."""
-    cmd = ['timidity', '-iA', '-x', 'soundfont {0}'.format(sfont)]
-    proc = subprocess.Popen(cmd, shell=False, stdout=subprocess.DEVNULL)
+def detect_audio_server(shm_dir=SHM_DIR):
+    """Return name of the audio server used in this session.
+
+    One of: 'pipewire', 'jack', 'pulseaudio', 'alsa'.
+    """
+    if os.path.exists(os.path.join(xdg.RUNTIME_DIR, 'pipewire-0')):
+        return 'pipewire'
+    if jack_server_running(shm_dir):
+        return 'jack'
+    if os.environ.get('PULSE_SERVER') or \
+       os.path.exists(os.path.join(xdg.RUNTIME_DIR, 'pulse', 'native')):
+        return 'pulseaudio'
+    return 'alsa'
+
+
+def fluidsynth_audio_args(server, profile):
+    """Return FluidSynth command line options for audio output."""
+    # PipeWire is used through its PulseAudio interface; FluidSynth
+    # 'pipewire' driver is missing in many distributions.
+    driver = {'jack': 'jack', 'alsa': 'alsa'}.get(server, 'pulseaudio')
+    args = ['-a', driver]
+    if driver == 'jack':
+        args.append('-j')  # connect outputs to system playback ports
+    if profile:
+        args += ['-z', str(profile.period_size), '-c', str(profile.periods)]
+    if profile and driver != 'jack':  # JACK server decides the rate
+        args += ['-r', str(SYNTH_SAMPLE_RATE)]
+    return args
+
+
+def timidity_audio_args(server, profile):
+    """Return TiMidity++ command line options for audio output."""
+    # PulseAudio and PipeWire are used through ALSA plugins.
+    args = ['-Oj' if server == 'jack' else '-Os']
+    if profile:
+        args.append('-B' + profile.timidity_buffer)
+    if profile and server != 'jack':  # JACK server decides the rate
+        args += ['-s', str(SYNTH_SAMPLE_RATE)]
+    return args
+
+
+def audio_env(server, profile):
+    """Return environment for synthesiser process."""
+    env = dict(os.environ)
+    if profile and server in ('pipewire', 'pulseaudio'):
+        env['PULSE_LATENCY_MSEC'] = str(profile.pulse_latency_ms)
+    return env
+
+
+def audio_output():
+    """Return audio server and latency profile to use for synthesiser."""
+    server = detect_audio_server()
+    latency = settings.get_midi_latency()
+    log('Audio server: {0} (latency: {1})'.format(server, latency))
+    return server, LATENCY_PROFILES[latency]
+
+
+def start_synth_process(cmd, name_expr, sfont, env=None, shell_port=None):
+    """Start software synthesizer process and wait until it's ready.
+
+    name_expr is a regular expression matching sequencer client name of
+    the new process; '{pid}' in it is replaced with the process pid.
+    shell_port is the port of FluidSynth shell server (if enabled).
+
+    Return sequencer port of the new process or None.
+    """
+    shared = settings.get_midi_keep_alive() > 0 and SHARED_SYNTH.retire()
+    # Client names are not unique (e.g. every TiMidity++ is 'TiMidity'),
+    # so only ports opened after the process started can be its own.
+    snapshot = sequencer_snapshot()
+    snapshot.refresh()
+    known_ports = {port.addr for port in snapshot.ports}
+    proc = subprocess.Popen(cmd,
+                            shell=False,
+                            env=env,
+                            stdout=subprocess.DEVNULL,
+                            start_new_session=shared)
     log('Starting MIDI client (pid: {0})'.format(proc.pid))
     log('Using soundfont: {0}'.format(sfont))
-    time.sleep(1.0)  # TODO properly wait until sequencer is online
-    atexit.register(stop_software_midi_synth, proc.pid)
+    port = wait_for_synth_port(proc,
+                               name_expr.format(pid=proc.pid),
+                               settings.get_midi_startup_timeout(),
+                               known_ports=known_ports)
+    if shared and port:
+        SHARED_SYNTH.register(proc.pid, cmd[0], sfont, port, shell_port)
+        SHARED_SYNTH.lease(port)
+    else:
+        atexit.register(stop_software_midi_synth, proc.pid)
+    return port
+
+
+def start_timidity(sfont):
+    """Start TiMidity++ process.
+
+    Return sequencer port of the new process or None.
+    """
+    server, profile = audio_output()
+    cmd = ['timidity', '-iA'] + timidity_audio_args(server, profile) + \
+          ['-x', 'soundfont {0}'.format(sfont)]
+    return start_synth_process(cmd, r'timidity', sfont,
+                               audio_env(server, profile))
 
 
 def start_fluidsynth(sfont):
-    """Start FluidSynth process."""
-    cmd = ['fluidsynth', '-a', 'pulseaudio', sfont]
-    proc = subprocess.Popen(cmd, shell=False, stdout=subprocess.DEVNULL)
-    log('Starting MIDI client (pid: {0})'.format(proc.pid))
-    log('Using soundfont: {}'.format(sfont))
-    time.sleep(1.0)  # TODO properly wait until sequencer is online
-    atexit.register(stop_software_midi_synth, proc.pid)
+    """Start FluidSynth process.
+
+    Return sequencer port of the new process or None.
+    """
+    server, profile = audio_output()
+    cmd = ['fluidsynth'] + fluidsynth_audio_args(server, profile)
+    shell_port = None
+    if settings.get_midi_keep_alive() > 0:
+        # Shared synthesizer can switch soundfonts through shell server.
+        shell_port = free_tcp_port()
+        cmd += ['-i', '-s', '-o', 'shell.port={0}'.format(shell_port)]
+    cmd.append(sfont)
+    return start_synth_process(cmd, r'fluid synth \({pid}\)', sfont,
+                               audio_env(server, profile), shell_port)
+
+
+def free_tcp_port():
+    """Return a TCP port number, that is not used at the moment."""
+    import socket  # pylint: disable=import-outside-toplevel
+    with socket.socket() as sock:
+        sock.bind((FLUIDSYNTH_SHELL_HOST, 0))
+        return sock.getsockname()[1]
+
+
+class FluidSynthShell:
+    """Client of FluidSynth shell server (started with -s option)."""
+
+    SENTINEL = 'boxtron-end-of-output'
+
+    def __init__(self, port, timeout=FLUIDSYNTH_SHELL_TIMEOUT):
+        self.port = port
+        self.timeout = timeout
+
+    def run(self, *commands):
+        """Execute shell commands and return lines of their output.
+
+        Raise OSError if the server is not reachable.
+        """
+        import socket  # pylint: disable=import-outside-toplevel
+        # Server does not mark the end of output, so echo a known line
+        # after the commands and read until it shows up.
+        script = ''.join(cmd + '\n' for cmd in commands)
+        script += 'echo {0}\n'.format(self.SENTINEL)
+        output = b''
+        with socket.create_connection((FLUIDSYNTH_SHELL_HOST, self.port),
+                                      timeout=self.timeout) as sock:
+            sock.sendall(script.encode('utf-8'))
+            while self.SENTINEL.encode('utf-8') not in output:
+                data = sock.recv(4096)
+                if not data:
+                    raise ConnectionError('FluidSynth shell disconnected')
+                output += data
+        lines = output.decode('utf-8', 'replace').splitlines()
+        lines = [line.lstrip('> ') for line in lines]
+        return lines[:lines.index(self.SENTINEL)]
+
+    def fonts(self):
+        """Return list of ids of loaded soundfonts."""
+        ids = []
+        for line in self.run('fonts'):
+            words = line.split()
+            if words and words[0].isdigit():
+                ids.append(int(words[0]))
+        return ids
+
+    def load(self, sfont):
+        """Load soundfont file; return its id or None on failure."""
+        if not os.path.isabs(sfont) or re.search(r'\s', sfont):
+            return None  # shell can't handle relative paths or whitespace
+        for line in self.run('load {0}'.format(sfont)):
+            match = re.match(r'loaded SoundFont has ID (\d+)', line)
+            if match:
+                return int(match.group(1))
+        return None
+
+    def unload(self, sfont_id):
+        """Unload soundfont and free memory used by its samples."""
+        self.run('unload {0}'.format(sfont_id))
+
+    def swap_soundfont(self, sfont):
+        """Replace all loaded soundfonts with a new one.
+
+        Return True on success.
+        """
+        old_ids = self.fonts()
+        new_id = self.load(sfont)
+        if new_id is None:
+            return False
+        for sfont_id in old_ids:
+            self.unload(sfont_id)
+        return True
 
 
 def stop_software_midi_synth(pid):
     """Stop software synthesizer process."""
     log('Stopping MIDI client {0}'.format(pid))
-    os.kill(pid, signal.SIGTERM)  # TODO ProcessLookupError:
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+
 
+def process_alive(pid, name=None):
+    """Test if process is running (and its name starts with name)."""
+    try:
+        with open('/proc/{0}/stat'.format(pid), 'r') as stat:
+            # Zombie already closed its files (and sequencer ports).
+            if stat.read().rpartition(')')[2].split()[0] == 'Z':
+                return False
+        with open('/proc/{0}/comm'.format(pid), 'r') as comm:
+            return comm.read().startswith((name or '')[:15])
+    except (OSError, IndexError):
+        return False
+
+
+def wait_for_exit(pid, name, timeout):
+    """Wait until process exits; return False if timeout expires first."""
+    deadline = time.monotonic() + timeout
+    interval = SYNTH_POLL_INTERVAL
+    while process_alive(pid, name):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, SYNTH_POLL_MAX_INTERVAL)
+    return True
+
+
+class SharedSynth:
+    """Software synthesizer shared between game launches.
+
+    Synthesizer is described in a state file in the runtime dir; every
+    Boxtron process using it holds a lease file named after its pid.
+    When the last lease is released, a detached watchdog process stops
+    the synthesizer after it stays idle for [midi] keep_alive seconds.
+    """
 
+    STATE_FILE = 'synth.json'
+
+    LEASE_PREFIX = 'synth_lease_'
+
+    def __init__(self):
+        self.leased = False
+
+    def __state_file__(self):
+        return xdg.runtime_path(self.STATE_FILE)
+
+    def __lease_file__(self, pid):
+        return xdg.runtime_path('{0}{1}'.format(self.LEASE_PREFIX, pid))
+
+    def load(self):
+        """Return state of a running shared synthesizer or None."""
+        try:
+            with open(self.__state_file__(), 'r') as state_file:
+                state = json.load(state_file)
+        except (OSError, ValueError):
+            return None
+        if not process_alive(state.get('pid'), state.get('tool')):
+            return None
+        return state
+
+    def register(self, pid, tool, sfont, port, shell_port=None):
+        """Record a new synthesizer as the shared one."""
+        self.__save__({
+            'pid': pid,
+            'tool': tool,
+            'sfont': sfont,
+            'port': port.addr,
+            'shell_port': shell_port,
+        })
+
+    def __save__(self, state):
+        toolbox.write_atomically(self.__state_file__(), json.dumps(state))
+
+    def __forget__(self):
+        try:
+            os.remove(self.__state_file__())
+        except FileNotFoundError:
+            pass
+
+    def retire(self):
+        """Stop shared synthesizer, so a new one can take its place.
+
+        Return False if the shared synthesizer is in use by another game.
+        """
+        state = self.load()
+        if not state:
+            return True
+        if self.active_leases():
+            return False
+        stop_software_midi_synth(state['pid'])
+        if not wait_for_exit(state['pid'], state.get('tool'),
+                             SYNTH_STOP_TIMEOUT):
+            log_warn('MIDI client (pid: {0}) did not exit '
+                     'in {1} seconds'.format(state['pid'], SYNTH_STOP_TIMEOUT))
+        self.__forget__()
+        return True
+
+    def reuse(self, sfont):
+        """Return port of the shared synthesizer using the same soundfont.
+
+        Idle FluidSynth gets the soundfont replaced, if it's using a different
+        one.  Return None if there's no such synthesizer running.
+        """
+        state = self.load()
+        if not state:
+            return None
+        if state.get('sfont') != sfont and \
+           not self.__switch_soundfont__(state, sfont):
+            return None
+        port = next((p for p in list_alsa_sequencer_ports()
+                     if p.addr == state['port'] and p.flags[1] == 'W'), None)
+        if port:
+            log('Using shared MIDI client (pid: {0})'.format(state['pid']))
+            self.lease(port)
+        return port
+
+    def __switch_soundfont__(self, state, sfont):
+        if not state.get('shell_port') or self.active_leases():
+            return False
+        try:
+            shell = FluidSynthShell(state['shell_port'])
+            if not shell.swap_soundfont(sfont):
+                log_warn('shared MIDI client failed to load', sfont)
+                return False
+        except OSError as err:
+            log_err('switching soundfont failed:', err)
+            return False
+        log('Switched shared MIDI client to soundfont: {0}'.format(sfont))
+        state['sfont'] = sfont
+        self.__save__(state)
+        return True
+
+    def lease(self, port):
+        """Prevent shared synthesizer from stopping while this process runs.
+
+        Nothing happens if port does not belong to the shared synthesizer.
+        """
+        if self.leased:
+            return
+        state = self.load()
+        if not state or state.get('port') != port.addr:
+            return
+        try:
+            with open(self.__lease_file__(os.getpid()), 'w'):
+                pass
+        except OSError as err:
+            log_err('leasing shared MIDI client failed:', err)
+            return
+        self.leased = True
+        atexit.register(self.release)
+
+    def active_leases(self):
+        """Return pids of processes holding a lease; remove stale leases."""
+        pids = []
+        runtime_dir = os.path.dirname(self.__state_file__())
+        try:
+            names = os.listdir(runtime_dir)
+        except OSError:
+            return pids
+        for name in names:
+            if not name.startswith(self.LEASE_PREFIX):
+                continue
+            pid = name[len(self.LEASE_PREFIX):]
+            if pid.isdigit() and os.path.isdir('/proc/' + pid):
+                pids.append(int(pid))
+                continue
+            try:
+                os.remove(os.path.join(runtime_dir, name))
+            except FileNotFoundError:
+                pass
+        return pids
+
+    def release(self):
+        """Release the lease; start idle watchdog if it was the last one."""
+        if not self.leased:
+            return
+        self.leased = False
+        try:
+            os.remove(self.__lease_file__(os.getpid()))
+            os.utime(self.__state_file__())
+        except FileNotFoundError:
+            pass
+        if self.active_leases():
+            return
+        keep_alive = settings.get_midi_keep_alive()
+        if keep_alive <= 0:
+            self.watch(0)
+            return
+        if os.fork() == 0:
+            # Detached watchdog; must not run exit handlers of the parent.
+            try:
+                os.setsid()
+                devnull = os.open(os.devnull, os.O_RDWR)
+                for stream in range(3):
+                    os.dup2(devnull, stream)
+                self.watch(keep_alive)
+            finally:
+                os._exit(0)  # pylint: disable=protected-access
+
+    def idle_time_left(self, keep_alive):
+        """Return seconds left until idle shared synthesizer should stop.
+
+        Return None if it's not running or someone is using it.
+        """
+        if not self.load() or self.active_leases():
+            return None
+        try:
+            idle = time.time() - os.stat(self.__state_file__()).st_mtime
+        except FileNotFoundError:
+            return None
+        return keep_alive - idle
+
+    def watch(self, keep_alive):
+        """Stop shared synthesizer after it's idle for keep_alive seconds."""
+        while True:
+            time_left = self.idle_time_left(keep_alive)
+            if time_left is None:
+                return
+            if time_left <= 0:
+                break
+            time.sleep(time_left)
+        state = self.load()
+        if state:
+            stop_software_midi_synth(state['pid'])
+        self.__forget__()
+
+
+SHARED_SYNTH = SharedSynth()
+
+
+def claim_port(port):
+    """Return port of a running synthesizer, if it can be used.
+
+    Shared synthesizer left running by a previous game is used only if
+    it has the soundfont selected for this game.
+    """
+    state = SHARED_SYNTH.load()
+    if not state or state.get('port') != port.addr:
+        return port
+    port = SHARED_SYNTH.reuse(settings.get_midi_soundfont())
+    if not port:
+        log('shared MIDI client uses a different soundfont')
+    return port
+
+
+@traced
 def detect_external_synth():
-    """Detect a synthesizer running in the background."""
+    """Detect a synthesizer running in the background.
+
+    Return its sequencer port or None.
+    """
     user_pref = settings.get_midi_sequencer()
     if user_pref:
-        if match_port_by_name(user_pref):
+        port = match_port_by_name(user_pref)
+        if port:
             # We found user's preferred port.
-            return True
+            return claim_port(port)
         log('synthesizer matching', user_pref, 'not found')
     else:
-        if find_midi_port():
-            # Synthesizer is already running (maybe as a service).
-            return True
+        port = find_midi_port()
+        if port:
+            # Synthesizer is already running (maybe as a service or
+            # shared with another game).
+            return claim_port(port)
         log('no synthesizer running in the background')
-    return False
+    return None
 
 
+@traced
 def start_midi_synth():
-    """Start software MIDI synthesizer according to user preferences."""
+    """Start software MIDI synthesizer according to user preferences.
+
+    Return sequencer port of the synthesizer or None.
+    """
     if not settings.get_midi_on():
-        return
+        return None
 
     # either user had preference but the preferred port was not found
     # or user had no preference and there was no appropriate port to use
@@ -159,7 +737,7 @@ def start_midi_synth():
 
     if not sfont:
         log_err("Can't start a software synthesizer without a soundfont")
-        return
+        return None
 
     preference_list = []
     if tool == 'timidity':
@@ -167,15 +745,19 @@ def start_midi_synth():
     elif tool == 'fluidsynth':
         preference_list = ['fluidsynth', 'timidity']
 
+    if settings.get_midi_keep_alive() > 0:
+        port = SHARED_SYNTH.reuse(sfont)
+        if port:
+            return port
+
     log('Trying to start {} or {}'.format(*preference_list))
 
     for tool in preference_list:
         if not toolbox.which(tool):
             continue
         if tool == 'timidity':
-            start_timidity(sfont)
-            return
+            return start_timidity(sfont)
         if tool == 'fluidsynth':
-            start_fluidsynth(sfont)
-            return
+            return start_fluidsynth(sfont)
     log_warn('no software MIDI synthesizer available')
+    return None
@@ -11,6 +11,8 @@ import tarfile
 
 import toolbox
 
+from tracing import traced
+
 CHECKSUM = 'c0452d6addcde172b71cac7b339e074f5f13a7ad83f2ee4736d47025dcbc760e'
 
 
@@ -30,6 +32,7 @@ def __checksum__():
     return toolbox.sha256sum(find_resource_file())
 
 
+@traced
 def verify():
     """Basic verification if file originates from release."""
     rfile = find_resource_file()
@@ -66,6 +69,7 @@ class ResourceFile:
         pfx = 'preconfig/{}/'.format(app_id)
         return bool(list(self.filter_pfx(pfx)))
 
+    @traced
     def extract(self, app_id, resource):
         """Extract all files for named app_id and resource to working dir."""
         pfx = 'preconfig/{}/{}/'.format(app_id, resource)
@@ -74,6 +78,7 @@ class ResourceFile:
             xfile.name = xfile.name.replace(pfx, '')
         self.tar.extractall(path='.', members=xlist, numeric_owner=True)
 
+    @traced
     def apply_rpatch(self, app_id, resource):
         """Apply resource patch if it exists."""
         path = 'preconfig/{}/{}.rpatch'.format(app_id, resource)
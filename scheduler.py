@@ -0,0 +1,84 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# Copyright (C) 2019-2021  Patryk Obara <patryk.obara@gmail.com>
+
+"""
+Concurrent execution of independent launch steps.
+
+Most of the work done before starting DOSBox is waiting for I/O (X server
+queries, looking for files, reading procfs, hashing resource file), so
+independent steps can overlap instead of running one after another.
+"""
+
+import concurrent.futures
+
+MAX_WORKERS = 4
+
+
+class TaskGraph:
+    """Small graph of named tasks executed on a thread pool.
+
+    A task starts only after all tasks it depends on are finished.
+    Dependencies need to be added before the tasks depending on them;
+    their results are passed to the task after its own arguments, if
+    requested.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.max_workers = max_workers
+        self.executor = None
+        self.futures = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.shutdown()
+
+    def add(self, name, func, *args, deps=(), pass_results=False):
+        """Start running func(*args) in background as a named task.
+
+        With pass_results, func is called with results of deps appended
+        to args.
+        """
+        assert name not in self.futures
+        dep_futures = [self.futures[dep] for dep in deps]
+        if self.executor is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix='boxtron')
+        self.futures[name] = self.executor.submit(self.__run__, dep_futures,
+                                                  func, args, pass_results)
+
+    @staticmethod
+    def __run__(dep_futures, func, args, pass_results):
+        results = tuple(future.result() for future in dep_futures)
+        if pass_results:
+            return func(*args, *results)
+        return func(*args)
+
+    def pop(self, name, func=None):
+        """Wait for a task to finish and return its result.
+
+        Task is forgotten afterwards.  If there's no such task, then func
+        is called in the current thread instead (if given).
+        """
+        future = self.futures.pop(name, None)
+        if future is None:
+            return func() if func else None
+        return future.result()
+
+    def wait(self):
+        """Wait for all tasks; exception raised by any task is re-raised."""
+        for future in self.futures.values():
+            future.result()
+
+    def shutdown(self):
+        """Wait for all tasks and stop worker threads."""
+        if self.executor:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        self.futures.clear()
+
+
+# Probes started early during the launch, picked up when needed.
+#
+LAUNCH_TASKS = TaskGraph()
@@ -8,15 +8,18 @@ Settings file creation and handling.
 # pylint: disable=missing-docstring
 
 import configparser
+import json
 import os
 import shlex
 import itertools
 
+import display
 import xdg
-import xlib
 
 from log import log, log_err, log_warn
-from toolbox import enabled_in_env
+from scheduler import TaskGraph
+from toolbox import enabled_in_env, write_atomically
+from tracing import traced
 
 SETTINGS_FILE = os.path.join(xdg.CONF_HOME, 'boxtron.conf')
 
@@ -28,10 +31,20 @@ DEFAULT_MIDI_TOOL = 'timidity'
 
 DEFAULT_MIDI_SEQ_REGEX = r''
 
+DEFAULT_MIDI_STARTUP_TIMEOUT = 5.0
+
+DEFAULT_MIDI_KEEP_ALIVE = 0
+
+DEFAULT_MIDI_LATENCY = 'medium'
+
+MIDI_LATENCY_TARGETS = ('low', 'medium', 'high')
+
 DEFAULT_SOUNDFONT = 'FluidR3_GM.sf2'
 
 BACKUP_SOUNDFONTS = ['FluidR3.sf2', 'FluidR3_GM2-2.sf2']
 
+SOUNDFONT_CACHE_FILE = 'soundfont.json'
+
 DEFAULT_DOSBOX_BINARY = 'dosbox'
 
 DEFAULT_FULLSCREEN_MODE = 'screen 0'
@@ -67,6 +80,26 @@ synthesiser = {midi_tool}
 #
 # use_sequencer =
 
+# How long (in seconds) to wait for software synthesiser to become ready.
+#
+# startup_timeout = {midi_startup_timeout}
+
+# Keep software synthesiser running for this many seconds after the game
+# ends, so the next game can use it without waiting for the soundfont
+# to load again.  Set to 0 to stop the synthesiser together with the game.
+#
+# Note: the synthesiser is started by the game, so Steam may show the game
+# as running until the synthesiser stops (up to keep_alive seconds after
+# quitting the game).
+#
+# keep_alive = {midi_keep_alive}
+
+# Audio latency target of software synthesiser: 'low', 'medium' or 'high'.
+# Lower latency keeps music in sync with other sounds in the game, but may
+# cause crackling on slower machines; 'high' uses synthesiser defaults.
+#
+# latency = {midi_latency}
+
 # Boxtron will look for a soundfont in following directories:
 # /usr/share/soundfonts/
 # /usr/share/sounds/sf2/
@@ -74,6 +107,9 @@ synthesiser = {midi_tool}
 # /usr/local/share/sounds/sf2/
 # ~/.local/share/sounds/sf2/  (or wherever XDG_DATA_HOME points)
 # ~/.local/share/soundfonts/  (or wherever XDG_DATA_HOME points)
+#
+# You can override this per-game with BOXTRON_SOUNDFONT environment variable.
+# Shared FluidSynth (see keep_alive) switches soundfonts without restarting.
 soundfont = {midi_soundfont}
 
 [dosbox]
@@ -111,9 +147,11 @@ class Settings():
         self.store.add_section('dosbox')
         self.store.read(conf or SETTINGS_FILE)
         self.fullresolution = 'desktop'
+        self.host_rate = None
         self.finalized = False
         self.distdir = os.path.dirname(os.path.abspath(__file__))
 
+    @traced
     def setup(self):
         """Finalise settings initialisation on request.
 
@@ -121,12 +159,14 @@ class Settings():
         which might fail or leave extensive logs on stderr.  We want this
         part of settings initialisation only when actually needed.
         """
-        self.__setup_fullscreen__()
-        midi_on = self.get_midi_on()
-        if midi_on:
-            self.__assure_sf2_exists__()
+        with TaskGraph() as tasks:
+            tasks.add('fullscreen', self.__setup_fullscreen__)
+            if self.get_midi_on():
+                tasks.add('soundfont', self.__assure_sf2_exists__)
+            tasks.wait()
         self.finalized = True
 
+    @traced
     def __setup_fullscreen__(self):
         user_choice = self.get_dosbox_fullscreenmode()
         env_override = 'BOXTRON_SCREEN' in os.environ or \
@@ -138,17 +178,21 @@ class Settings():
             return
 
         screen = self.__get_screen_number__()
-        all_screens = xlib.query_screens()
+        all_screens = display.query_screens()
 
         if all_screens == {}:
             log_err('no screens detected')
         for number, info in all_screens.items():
-            log("screen '{}': {}x{}".format(number, info.width, info.height))
+            log("screen '{}': {}x{}{}{}".format(
+                number, info.width, info.height,
+                ' @ {:.2f}Hz'.format(info.refresh) if info.refresh else '',
+                ' (primary)' if info.primary else ''))
 
         if screen not in all_screens:
             log("screen '{}' not found".format(screen))
-            if '0' in all_screens:
-                screen = '0'
+            primary = [n for n, i in all_screens.items() if i.primary]
+            if primary or '0' in all_screens:
+                screen = (primary + ['0'])[0]
                 log("using '" + screen + "' instead")
             else:
                 log("using desktop as screen instead")
@@ -159,6 +203,7 @@ class Settings():
         os.putenv('SDL_VIDEO_FULLSCREEN_HEAD', screen)  # SDL >= 1.2.10
         info = all_screens[screen]
         self.fullresolution = '{}x{}'.format(info.width, info.height)
+        self.host_rate = info.refresh
 
     def __get_screen_number__(self):
         tokens = self.get_dosbox_fullscreenmode().split()
@@ -179,6 +224,13 @@ class Settings():
     def get_str(self, section, val, default):
         return self.store.get(section, val, fallback=default)
 
+    def get_float(self, section, val, default):
+        try:
+            return self.store.getfloat(section, val, fallback=default)
+        except ValueError as err:
+            log_err('invalid {}.{} value:'.format(section, val), err)
+            return default
+
     def get_confgen_force(self):
         return self.get_bool('confgen', 'force', DEFAULT_CONFGEN_FORCE)
 
@@ -203,6 +255,21 @@ class Settings():
         seq = seq.strip('\'\"')
         return os.environ.get('BOXTRON_USE_MIDI_SEQ', seq)
 
+    def get_midi_startup_timeout(self):
+        return self.get_float('midi', 'startup_timeout',
+                              DEFAULT_MIDI_STARTUP_TIMEOUT)
+
+    def get_midi_keep_alive(self):
+        return self.get_float('midi', 'keep_alive', DEFAULT_MIDI_KEEP_ALIVE)
+
+    def get_midi_latency(self):
+        latency = self.get_str('midi', 'latency', DEFAULT_MIDI_LATENCY)
+        latency = latency.strip().lower()
+        if latency not in MIDI_LATENCY_TARGETS:
+            log_err('invalid midi.latency value:', latency)
+            return DEFAULT_MIDI_LATENCY
+        return latency
+
     def get_dosbox_cmd(self):
         # dosbox.cmd is new name for dosbox.bin
         dosbox_cmd = self.get_str('dosbox', 'cmd', None)
@@ -234,12 +301,25 @@ class Settings():
         assert self.finalized
         return self.fullresolution
 
+    def get_dosbox_host_rate(self):
+        assert self.finalized
+        return self.host_rate
+
     def get_dosbox_scaler(self):
         return self.get_str('dosbox', 'scaler', DEFAULT_SCALER)
 
+    @traced
     def __assure_sf2_exists__(self):
         sf2 = self.get_str('midi', 'soundfont', DEFAULT_SOUNDFONT)
+        sf2 = os.environ.get('BOXTRON_SOUNDFONT', sf2)
         data_dirs = [os.path.join(self.distdir, 'share')] + xdg.get_data_dirs()
+        search_key = {'soundfont': sf2, 'data_dirs': data_dirs}
+        cached_sf2 = load_cached_soundfont(search_key)
+        if cached_sf2 and os.path.basename(cached_sf2) == sf2 and \
+           os.path.isfile(cached_sf2):
+            log('found soundfont:', cached_sf2)
+            self.store.set('midi', 'soundfont', cached_sf2)
+            return
         use_sf2 = ''
         sf2_paths = (os.path.join(d, s, n) for n, d, s in itertools.product(
             [sf2, DEFAULT_SOUNDFONT] + BACKUP_SOUNDFONTS + ['default.sf2'],
@@ -259,9 +339,29 @@ class Settings():
         _, found_file = os.path.split(use_sf2)
         if found_file != sf2:
             log_warn(sf2, 'soundfont not found. Using', found_file, 'instead.')
+        else:
+            save_cached_soundfont(search_key, use_sf2)
         self.store.set('midi', 'soundfont', use_sf2)
 
 
+def load_cached_soundfont(search_key):
+    """Return soundfont path found previously for the same search."""
+    try:
+        with open(xdg.cache_path(SOUNDFONT_CACHE_FILE), 'r') as cache:
+            cached = json.load(cache)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cached, dict) or cached.get('key') != search_key:
+        return None
+    return cached.get('path')
+
+
+def save_cached_soundfont(search_key, path):
+    """Remember soundfont path found for a search."""
+    cached = {'key': search_key, 'path': path}
+    write_atomically(xdg.cache_path(SOUNDFONT_CACHE_FILE), json.dumps(cached))
+
+
 def init_settings_file():
     os.makedirs(xdg.CONF_HOME, exist_ok=True)
     old_settings_file = os.path.join(xdg.CONF_HOME, 'steam-dos.conf')
@@ -289,6 +389,9 @@ def init_settings_file():
             confgen_force=str(old.get_confgen_force()).lower(),
             midi_enable=str(old_midi_enable).lower(),
             midi_tool=old.get_midi_tool(),
+            midi_startup_timeout=DEFAULT_MIDI_STARTUP_TIMEOUT,
+            midi_keep_alive=DEFAULT_MIDI_KEEP_ALIVE,
+            midi_latency=DEFAULT_MIDI_LATENCY,
             midi_soundfont=old_midi_sf,
             fullscreen_mode=old.get_dosbox_fullscreenmode(),
             scaler=old.get_dosbox_scaler(),
@@ -303,6 +406,9 @@ def init_settings_file():
             confgen_force=str(DEFAULT_CONFGEN_FORCE).lower(),
             midi_enable=str(DEFAULT_MIDI_ENABLE).lower(),
             midi_tool=DEFAULT_MIDI_TOOL,
+            midi_startup_timeout=DEFAULT_MIDI_STARTUP_TIMEOUT,
+            midi_keep_alive=DEFAULT_MIDI_KEEP_ALIVE,
+            midi_latency=DEFAULT_MIDI_LATENCY,
             midi_soundfont=DEFAULT_SOUNDFONT,
             fullscreen_mode=DEFAULT_FULLSCREEN_MODE,
             scaler=DEFAULT_SCALER,
@@ -311,6 +417,23 @@ def init_settings_file():
             file.write(content.lstrip())
 
 
-init_settings_file()
+class LazySettings():
+    """Settings created on the first access to any setting.
+
+    Creating settings might write boxtron.conf, so it's deferred until
+    a code path actually needs them.
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self):
+        self.settings = None
+
+    def __getattr__(self, name):
+        if self.settings is None:
+            init_settings_file()
+            self.settings = Settings()
+        return getattr(self.settings, name)
+
 
-SETTINGS = Settings()
+SETTINGS = LazySettings()
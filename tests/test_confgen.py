@@ -7,9 +7,12 @@
 # pylint: disable=wrong-spelling-in-comment
 
 import os
+import shutil
+import tempfile
 import unittest
 
 import confgen
+import xdg
 
 
 class TestConfGenerator(unittest.TestCase):
@@ -36,6 +39,99 @@ class TestDosboxArgParser(unittest.TestCase):
         self.assertEqual(dargs.conf, ['dosbox.conf'])
 
 
+class TestDosboxConfigParser(unittest.TestCase):
+
+    def test_sections_and_autoexec(self):
+        config = confgen.DosboxConfigParser()
+        config.read_string('\n'.join([
+            'ignored=line',
+            '[sdl]',
+            '# comment',
+            'fullscreen = true',
+            'output',
+            '[autoexec]',
+            '@echo off',
+            'mount c .',
+        ]))
+        self.assertEqual(config.sections(), ['sdl', 'autoexec'])
+        self.assertEqual(dict(config['sdl']), {'fullscreen': 'true',
+                                               'output': None})
+        self.assertEqual(config.get_autoexec(), ['@echo off', 'mount c .'])
+
+
+class TestConfEncoding(unittest.TestCase):
+
+    def test_ascii(self):
+        self.assertEqual(confgen.decode_conf_bytes(b'[sdl]\n'),
+                         ('[sdl]\n', 'utf-8'))
+
+    def test_utf8(self):
+        data = 'echo zażółć'.encode('utf-8')
+        self.assertEqual(confgen.decode_conf_bytes(data),
+                         ('echo zażółć', 'utf-8'))
+
+    def test_box_drawing(self):
+        data = 'echo ╔══╗'.encode('cp437')
+        self.assertEqual(confgen.decode_conf_bytes(data),
+                         ('echo ╔══╗', 'cp437'))
+
+    def test_central_european(self):
+        data = 'echo zażółć gęślą jaźń'.encode('cp1250')
+        self.assertEqual(confgen.decode_conf_bytes(data),
+                         ('echo zażółć gęślą jaźń', 'cp1250'))
+
+    def test_undefined_in_cp1250(self):
+        data = b'echo \x81\xe9'
+        self.assertEqual(confgen.decode_conf_bytes(data)[1], 'cp437')
+
+
+class TestConfCache(unittest.TestCase):
+
+    def setUp(self):
+        self.original_cache_home = xdg.CACHE_HOME
+        self.original_cache = confgen.CONF_CACHE
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        xdg.CACHE_HOME = os.path.join(self.tmp_dir.name, 'cache')
+        self.conf = os.path.join(self.tmp_dir.name, 'sb1.conf')
+        shutil.copy('tests/files/confs/sb1.conf', self.conf)
+        os.utime(self.conf, ns=(10**9, 10**9))
+        confgen.CONF_CACHE = confgen.ConfCache()
+
+    def tearDown(self):
+        xdg.CACHE_HOME = self.original_cache_home
+        confgen.CONF_CACHE = self.original_cache
+        self.tmp_dir.cleanup()
+
+    def test_cached_conf(self):
+        conf, enc = confgen.parse_dosbox_config(self.conf)
+        confgen.CONF_CACHE.save()
+        confgen.CONF_CACHE = confgen.ConfCache()
+        cached = confgen.CONF_CACHE.get(
+            os.path.realpath(self.conf),
+            [os.stat(self.conf).st_size, 10**9, os.stat(self.conf).st_ino])
+        self.assertIsNotNone(cached)
+        cached_conf, cached_enc = cached
+        self.assertEqual(cached_enc, enc)
+        self.assertEqual(cached_conf.sections(), conf.sections())
+        self.assertEqual(dict(cached_conf['sblaster']),
+                         dict(conf['sblaster']))
+        self.assertEqual(cached_conf.get_autoexec(), conf.get_autoexec())
+
+    def test_modified_conf(self):
+        confgen.parse_dosbox_config(self.conf)
+        with open(self.conf, 'a') as conf_file:
+            conf_file.write('[autoexec]\necho modified\n')
+        conf, _ = confgen.parse_dosbox_config(self.conf)
+        self.assertEqual(conf.get_autoexec(), ['echo modified'])
+
+    def test_unusable_cache_dir(self):
+        xdg.CACHE_HOME = self.conf  # not a directory
+        conf, _ = confgen.parse_dosbox_config(self.conf)
+        confgen.CONF_CACHE.save()
+        self.assertTrue(confgen.CONF_CACHE.modified)
+        self.assertIn('sblaster', conf.sections())
+
+
 def raw_autoexec_section(path):
     out = False
     with open(path, 'r') as txt:
@@ -223,6 +319,12 @@ class TestDosboxConfiguration(unittest.TestCase):
         new = ['mount C "Dir"', 'mount D "A B"', 'mount E "abc/DEF"']
         self.assertEqual(list(confgen.to_linux_autoexec(old)), new)
 
+    def test_fix_autoexec_short_names(self):
+        os.chdir('tests/files')
+        old = ['mount c SOMEWH~1']
+        new = ['mount C "somewhat_long_path"']
+        self.assertEqual(list(confgen.to_linux_autoexec(old)), new)
+
     def test_imgmount_params_1(self):
         params_in = r"""'game cd\cd1.iso' "game cd\cd2.iso" -t iso"""
         paths = [r'game cd\cd1.iso', r'game cd\cd2.iso']
@@ -263,8 +365,8 @@ class TestDosboxConfiguration(unittest.TestCase):
                                            exe=args.file,
                                            noautoexec=args.noautoexec,
                                            exit_after_exe=args.exit)
-        # at the very least, autoexec should be filled
-        self.assertEqual(conf.encoding, 'cp1250')
+        # autoexec uses box drawing characters from code page 437
+        self.assertEqual(conf.encoding, 'cp437')
 
     # Arctic Adventure 1, 2, 3, 4
     #
@@ -303,6 +405,22 @@ class TestDosboxConfiguration(unittest.TestCase):
         self.clean_after_test = auto_conf
         self.assertTrue(os.path.isfile(auto_conf))
 
+    # File is not re-written when the environment did not change.
+    #
+    def test_auto_config_unchanged(self):
+        os.chdir('tests/files/confs')
+        cmd_line = ['-conf', 'empty_autoexec.conf']
+        conf = confgen.create_dosbox_configuration(cmd_line, tweak_conf={})
+        auto_conf = confgen.create_auto_conf_file(conf)
+        self.clean_after_test = auto_conf
+        inode = os.stat(auto_conf).st_ino
+        confgen.create_auto_conf_file(conf)
+        self.assertEqual(os.stat(auto_conf).st_ino, inode)
+        with open(auto_conf, 'a') as auto:
+            auto.write('# modified\n')
+        confgen.create_auto_conf_file(conf)
+        self.assertNotEqual(os.stat(auto_conf).st_ino, inode)
+
 
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
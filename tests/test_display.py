@@ -0,0 +1,139 @@
+#!/usr/bin/python3
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+# Copyright (C) 2019-2021  Patryk Obara <patryk.obara@gmail.com>
+
+# pylint: disable=missing-docstring
+# pylint: disable=wrong-spelling-in-comment
+
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+import display
+
+SCREENS = {
+    '0': display.ScreenInfo(0, 1920, 1080, 0, 0, 60.0, True),
+    '1': display.ScreenInfo(1, 1280, 1024, 1920, 0, 75.025, False),
+}
+
+DRM_FILES = 'tests/files/drm'
+
+DRM_SCREENS = {
+    '0': display.ScreenInfo(0, 2560, 1440, 0, 0, None, False),
+    '1': display.ScreenInfo(1, 1920, 1200, 2560, 0, None, False),
+}
+
+
+class TestScreensCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.drm_dir = os.path.join(self.tmp_dir.name, 'drm')
+        self.add_connector('card0-HDMI-A-1', 'connected', '1920x1080')
+        os.mkdir(os.path.join(self.drm_dir, 'card0'))
+        self.patches = [
+            mock.patch('xdg.RUNTIME_DIR', self.tmp_dir.name),
+            mock.patch('display.DRM_SYSFS', self.drm_dir),
+            mock.patch.dict(os.environ, DISPLAY=':0'),
+        ]
+        for patch in self.patches:
+            patch.start()
+        self.query_patch = mock.patch('xlib.query_screens',
+                                      return_value=SCREENS)
+        self.query = self.query_patch.start()
+
+    def tearDown(self):
+        self.query_patch.stop()
+        for patch in self.patches:
+            patch.stop()
+        self.tmp_dir.cleanup()
+
+    def add_connector(self, name, status, modes):
+        path = os.path.join(self.drm_dir, name)
+        os.makedirs(path)
+        for attr, val in (('status', status), ('modes', modes)):
+            with open(os.path.join(path, attr), 'w') as file:
+                file.write(val + '\n')
+
+    def test_signature(self):
+        self.assertEqual(display.drm_signature(self.drm_dir),
+                         [['card0-HDMI-A-1', 'connected', None, '1920x1080']])
+        self.assertEqual(display.drm_signature('/nonexistent'), [])
+
+    def test_cache_hit(self):
+        self.assertEqual(display.query_screens(), SCREENS)
+        self.assertEqual(display.query_screens(), SCREENS)
+        self.assertEqual(self.query.call_count, 1)
+
+    def test_connector_change(self):
+        display.query_screens()
+        self.add_connector('card0-DP-1', 'connected', '1280x1024')
+        display.query_screens()
+        self.assertEqual(self.query.call_count, 2)
+
+    def test_display_change(self):
+        display.query_screens()
+        os.environ['DISPLAY'] = ':1'
+        display.query_screens()
+        self.assertEqual(self.query.call_count, 2)
+
+    def test_no_drm(self):
+        with mock.patch('display.DRM_SYSFS', '/nonexistent'):
+            display.query_screens()
+            display.query_screens()
+        self.assertEqual(self.query.call_count, 2)
+
+    def test_stale_cache(self):
+        display.query_screens()
+        cache = os.path.join(self.tmp_dir.name, 'boxtron',
+                             display.SCREENS_CACHE_FILE)
+        os.utime(cache, (0, 0))
+        display.query_screens()
+        self.assertEqual(self.query.call_count, 2)
+
+    def test_unusable_runtime_dir(self):
+        with mock.patch('xdg.RUNTIME_DIR', __file__):  # not a directory
+            self.assertEqual(display.query_screens(), SCREENS)
+            self.assertEqual(display.query_screens(), SCREENS)
+        self.assertEqual(self.query.call_count, 2)
+
+    def test_no_display(self):
+        del os.environ['DISPLAY']
+        with mock.patch('display.DRM_SYSFS', DRM_FILES):
+            screens = display.query_screens()
+        self.assertEqual(screens, DRM_SCREENS)
+        self.query.assert_not_called()
+
+    def test_no_x_screens(self):
+        self.query.return_value = {}
+        with mock.patch('display.DRM_SYSFS', DRM_FILES):
+            screens = display.query_screens()
+            self.assertEqual(screens, DRM_SCREENS)
+            self.assertEqual(display.query_screens(), DRM_SCREENS)
+        self.assertEqual(self.query.call_count, 2)
+
+
+class TestDrmScreens(unittest.TestCase):
+
+    def test_connectors(self):
+        signature = display.drm_signature(DRM_FILES)
+        self.assertEqual(
+            [c[0] for c in signature],
+            ['card0-DP-1', 'card0-HDMI-A-1', 'card0-eDP-1', 'card1-DP-2'])
+        self.assertEqual(signature[1],
+                         ['card0-HDMI-A-1', 'disconnected', 'disabled', ''])
+
+    def test_screens(self):
+        signature = display.drm_signature(DRM_FILES)
+        self.assertEqual(display.drm_screens(signature), DRM_SCREENS)
+
+    def test_no_modes(self):
+        signature = [['card0-DP-1', 'connected', None, None]]
+        self.assertEqual(display.drm_screens(signature), {})
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
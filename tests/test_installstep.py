@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+# Copyright (C) 2019-2021  Patryk Obara <patryk.obara@gmail.com>
+
+# pylint: disable=missing-docstring
+# pylint: disable=wrong-spelling-in-comment
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+import installstep
+import xdg
+
+
+class TestInstallStep(unittest.TestCase):
+
+    def setUp(self):
+        self.original_runtime_dir = xdg.RUNTIME_DIR
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        xdg.RUNTIME_DIR = self.tmp_dir.name
+
+    def tearDown(self):
+        xdg.RUNTIME_DIR = self.original_runtime_dir
+        self.tmp_dir.cleanup()
+
+    @staticmethod
+    def current_step():
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            installstep.print_current_step()
+        return out.getvalue()
+
+    def test_steps(self):
+        self.assertEqual(self.current_step(), '')
+        installstep.set_current_step('1/2: foo')
+        self.assertEqual(self.current_step(), '1/2: foo')
+        installstep.set_current_step('2/2: bar')
+        self.assertEqual(self.current_step(), '2/2: bar')
+        installstep.clear_current_step()
+        installstep.clear_current_step()
+        self.assertEqual(self.current_step(), '')
+
+    def test_unusable_runtime_dir(self):
+        xdg.RUNTIME_DIR = __file__  # not a directory
+        installstep.set_current_step('1/2: foo')
+        self.assertEqual(self.current_step(), '')
+        installstep.clear_current_step()
+
+    def test_no_runtime_dir_created(self):
+        installstep.print_current_step()
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+    def test_current_step_query(self):
+        query = installstep.is_current_step_query
+        self.assertTrue(
+            query(['iscriptevaluator.exe', '--get-current-step', '1234']))
+        self.assertTrue(
+            query([
+                '--wait-before-run', '/a/iscriptevaluator.exe',
+                '--get-current-step', '1234'
+            ]))
+        self.assertFalse(query([]))
+        self.assertFalse(query(['iscriptevaluator.exe', 'script_1234.vdf']))
+        self.assertFalse(query(['dosbox.exe', '--get-current-step']))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
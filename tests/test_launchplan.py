@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+# Copyright (C) 2019-2021  Patryk Obara <patryk.obara@gmail.com>
+
+# pylint: disable=missing-docstring
+# pylint: disable=wrong-spelling-in-comment
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import launchplan
+import xdg
+
+
+class TestLaunchPlan(unittest.TestCase):
+
+    def setUp(self):
+        self.original_dir = os.getcwd()
+        self.original_cache_home = xdg.CACHE_HOME
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        xdg.CACHE_HOME = os.path.join(self.tmp_dir.name, 'cache')
+        self.game_dir = os.path.join(self.tmp_dir.name, 'game')
+        shutil.copytree('tests/files/confs', self.game_dir)
+        os.chdir(self.game_dir)
+        self.cmd_line = [os.path.join(self.game_dir, 'dosbox', 'dosbox.exe'),
+                         '-conf', 'C1.CONF']
+
+    def tearDown(self):
+        os.chdir(self.original_dir)
+        xdg.CACHE_HOME = self.original_cache_home
+        self.tmp_dir.cleanup()
+
+    def record_plan(self):
+        plan = launchplan.LaunchPlan()
+        plan.begin('1234', self.cmd_line)
+        self.assertFalse(plan.restore())
+        plan.record(['-conf', 'C1.CONF'])
+        plan.save()
+
+    def test_restore(self):
+        self.record_plan()
+        plan = launchplan.LaunchPlan()
+        plan.begin('1234', self.cmd_line)
+        self.assertTrue(plan.restore())
+        self.assertEqual(plan.cwd, self.game_dir)
+        self.assertEqual(plan.dosbox_args, ['-conf', 'C1.CONF'])
+
+    def test_unusable_cache_dir(self):
+        xdg.CACHE_HOME = os.path.join(self.game_dir, 'c1.conf')
+        self.record_plan()
+        plan = launchplan.LaunchPlan()
+        plan.begin('1234', self.cmd_line)
+        self.assertFalse(plan.restore())
+
+    def test_different_command(self):
+        self.record_plan()
+        plan = launchplan.LaunchPlan()
+        plan.begin('1234', self.cmd_line + ['-c', 'exit'])
+        self.assertFalse(plan.restore())
+
+    def test_input_modified(self):
+        self.record_plan()
+        os.utime('c1.conf', ns=(10**9, 10**9))
+        plan = launchplan.LaunchPlan()
+        plan.begin('1234', self.cmd_line)
+        self.assertFalse(plan.restore())
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
@@ -7,9 +7,18 @@
 # pylint: disable=wrong-spelling-in-comment
 
 import os
+import shutil
+import socket
+import socketserver
+import subprocess
+import tempfile
+import threading
+import time
 import unittest
+import unittest.mock
 
 import midi
+import xdg
 
 
 class TestAlsaMidiClients(unittest.TestCase):
@@ -79,5 +88,366 @@ class TestAlsaMidiClients(unittest.TestCase):
         self.assertEqual(found_ports, [])
 
 
+class TestSequencerSnapshot(unittest.TestCase):
+
+    def test_connections(self):
+        snapshot = midi.SequencerSnapshot('tests/files/alsa/port_14_via_wine')
+        self.assertEqual(snapshot.connected_from, {'129:1': ['14:0']})
+        self.assertEqual(len(snapshot.ports), 5)
+
+    def test_shared_snapshot(self):
+        fake_seq_list = 'tests/files/alsa/default'
+        snapshot = midi.sequencer_snapshot(fake_seq_list)
+        self.assertIs(midi.sequencer_snapshot(fake_seq_list), snapshot)
+
+    def test_refresh(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fake_seq_list = os.path.join(tmp_dir, 'clients')
+            shutil.copy('tests/files/alsa/default', fake_seq_list)
+            snapshot = midi.SequencerSnapshot(fake_seq_list)
+            self.assertIsNone(snapshot.match_port_by_name(r'fluid'))
+            shutil.copy('tests/files/alsa/fluid', fake_seq_list)
+            self.assertIsNone(snapshot.match_port_by_name(r'fluid'))
+            snapshot.refresh()
+            port = snapshot.match_port_by_name(r'fluid')
+            self.assertEqual(port.addr, '128:0')
+
+
+class FakeProcess:
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, returncode=None):
+        self.pid = 9541
+        self.returncode = returncode
+
+    def poll(self):
+        return self.returncode
+
+
+class TestSynthReadiness(unittest.TestCase):
+
+    def test_port_ready(self):
+        fake_seq_list = 'tests/files/alsa/fluid'
+        port = midi.wait_for_synth_port(FakeProcess(),
+                                        r'fluid synth \(9541\)',
+                                        timeout=5,
+                                        seq_clients=fake_seq_list)
+        self.assertEqual(port.addr, '128:0')
+
+    def test_port_of_other_client(self):
+        fake_seq_list = 'tests/files/alsa/combined'
+        snapshot = midi.SequencerSnapshot(fake_seq_list)
+        port = midi.wait_for_synth_port(FakeProcess(),
+                                        r'timidity',
+                                        timeout=0.05,
+                                        seq_clients=fake_seq_list,
+                                        known_ports={'128:0', '128:1'})
+        self.assertEqual(port.addr, '128:2')
+        port = midi.wait_for_synth_port(
+            FakeProcess(),
+            r'timidity',
+            timeout=0.05,
+            seq_clients=fake_seq_list,
+            known_ports={p.addr for p in snapshot.ports})
+        self.assertIsNone(port)
+
+    def test_process_exited(self):
+        fake_seq_list = 'tests/files/alsa/default'
+        port = midi.wait_for_synth_port(FakeProcess(returncode=1),
+                                        r'fluid',
+                                        timeout=5,
+                                        seq_clients=fake_seq_list)
+        self.assertIsNone(port)
+
+    def test_timeout(self):
+        fake_seq_list = 'tests/files/alsa/default'
+        port = midi.wait_for_synth_port(FakeProcess(),
+                                        r'fluid',
+                                        timeout=0.05,
+                                        seq_clients=fake_seq_list)
+        self.assertIsNone(port)
+
+
+class TestSharedSynth(unittest.TestCase):
+
+    def setUp(self):
+        self.original_runtime_dir = xdg.RUNTIME_DIR
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        xdg.RUNTIME_DIR = self.tmp_dir.name
+        self.synth = subprocess.Popen(['sleep', '60'])
+        while not midi.process_alive(self.synth.pid, 'sleep'):
+            time.sleep(0.01)  # wait for exec
+        self.port = midi.MidiPort('128:0', 'TiMidity', 'TiMidity port 0',
+                                  'User', '-We-')
+        self.shared = midi.SharedSynth()
+        self.shared.register(self.synth.pid, 'sleep', 'test.sf2', self.port)
+
+    def tearDown(self):
+        self.synth.kill()
+        self.synth.wait()
+        xdg.RUNTIME_DIR = self.original_runtime_dir
+        self.tmp_dir.cleanup()
+
+    def test_state(self):
+        state = self.shared.load()
+        self.assertEqual(state['pid'], self.synth.pid)
+        self.assertEqual(state['port'], '128:0')
+        self.synth.kill()
+        self.synth.wait()
+        self.assertIsNone(self.shared.load())
+
+    def test_lease(self):
+        other = midi.MidiPort('129:0', 'TiMidity', 'TiMidity port 0', 'User',
+                              '-We-')
+        self.shared.lease(other)
+        self.assertEqual(self.shared.active_leases(), [])
+        self.shared.lease(self.port)
+        self.assertEqual(self.shared.active_leases(), [os.getpid()])
+
+    def test_stale_lease(self):
+        stale = xdg.runtime_file(midi.SharedSynth.LEASE_PREFIX + '999999999')
+        with open(stale, 'w'):
+            pass
+        self.assertEqual(self.shared.active_leases(), [])
+        self.assertFalse(os.path.exists(stale))
+
+    def detect(self, sfont):
+        with unittest.mock.patch('midi.SHARED_SYNTH', self.shared), \
+             unittest.mock.patch('midi.find_midi_port',
+                                 return_value=self.port), \
+             unittest.mock.patch('midi.list_alsa_sequencer_ports',
+                                 return_value=[self.port]), \
+             unittest.mock.patch.object(midi.settings, 'get_midi_sequencer',
+                                        return_value=''), \
+             unittest.mock.patch.object(midi.settings, 'get_midi_soundfont',
+                                        return_value=sfont):
+            return midi.detect_external_synth()
+
+    def test_detect_same_soundfont(self):
+        self.assertEqual(self.detect('test.sf2'), self.port)
+        self.assertEqual(self.shared.active_leases(), [os.getpid()])
+
+    def test_detect_other_soundfont(self):
+        self.assertIsNone(self.detect('other.sf2'))
+        self.assertEqual(self.shared.active_leases(), [])
+
+    def test_retire(self):
+        self.shared.lease(self.port)
+        self.assertFalse(self.shared.retire())
+        os.remove(os.path.join(self.tmp_dir.name, 'boxtron',
+                               'synth_lease_{}'.format(os.getpid())))
+        self.assertTrue(self.shared.retire())
+        self.assertFalse(midi.process_alive(self.synth.pid))
+        self.assertEqual(self.synth.wait(timeout=5), -15)
+        self.assertIsNone(self.shared.load())
+        self.shared.leased = False
+
+    def test_watch_forgotten(self):
+        # Another game retired the synthesizer while watchdog was waiting.
+        with unittest.mock.patch.object(self.shared, 'idle_time_left',
+                                        return_value=0), \
+             unittest.mock.patch.object(self.shared, 'load',
+                                        return_value=None):
+            self.shared.watch(60)
+        self.assertIsNone(self.synth.poll())
+
+    def test_release(self):
+        self.shared.lease(self.port)
+        self.assertLess(self.shared.idle_time_left(60) or 0, 1)
+        self.shared.release()  # keep_alive is 0 by default
+        self.assertEqual(self.synth.wait(timeout=5), -15)
+        self.assertIsNone(self.shared.load())
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir.name,
+                                                 'boxtron')), [])
+
+
+class TestAudioOutput(unittest.TestCase):
+
+    def setUp(self):
+        self.original_runtime_dir = xdg.RUNTIME_DIR
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        xdg.RUNTIME_DIR = self.tmp_dir.name
+        self.shm_dir = os.path.join(self.tmp_dir.name, 'shm')
+        os.mkdir(self.shm_dir)
+        self.env = unittest.mock.patch.dict(os.environ)
+        self.env.start()
+        os.environ.pop('JACK_DEFAULT_SERVER', None)
+        os.environ.pop('PULSE_SERVER', None)
+        os.environ.pop('PULSE_LATENCY_MSEC', None)
+
+    def tearDown(self):
+        self.env.stop()
+        xdg.RUNTIME_DIR = self.original_runtime_dir
+        self.tmp_dir.cleanup()
+
+    def touch(self, *path):
+        with open(os.path.join(self.tmp_dir.name, *path), 'w'):
+            pass
+
+    def test_alsa(self):
+        self.assertEqual(midi.detect_audio_server(self.shm_dir), 'alsa')
+
+    def test_pulseaudio(self):
+        os.mkdir(os.path.join(self.tmp_dir.name, 'pulse'))
+        self.touch('pulse', 'native')
+        self.assertEqual(midi.detect_audio_server(self.shm_dir), 'pulseaudio')
+
+    def jack_socket(self, server='default'):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        name = 'jack_{0}_{1}_0'.format(server, os.getuid())
+        sock.bind(os.path.join(self.shm_dir, name))
+        self.addCleanup(sock.close)
+        return sock
+
+    def test_jack(self):
+        os.mkdir(os.path.join(self.tmp_dir.name, 'pulse'))
+        self.touch('pulse', 'native')
+        self.jack_socket().listen()
+        self.assertEqual(midi.detect_audio_server(self.shm_dir), 'jack')
+
+    def test_jack_named_server(self):
+        self.jack_socket('studio').listen()
+        self.assertEqual(midi.detect_audio_server(self.shm_dir), 'alsa')
+        os.environ['JACK_DEFAULT_SERVER'] = 'studio'
+        self.assertEqual(midi.detect_audio_server(self.shm_dir), 'jack')
+
+    def test_stale_jack_files(self):
+        self.touch('shm', 'jack_sem.1000_default_system')
+        self.jack_socket().close()  # socket file left by a crashed server
+        self.assertEqual(midi.detect_audio_server(self.shm_dir), 'alsa')
+
+    def test_pipewire(self):
+        self.jack_socket().listen()
+        self.touch('pipewire-0')
+        self.assertEqual(midi.detect_audio_server(self.shm_dir), 'pipewire')
+
+    def test_fluidsynth_args(self):
+        low = midi.LATENCY_PROFILES['low']
+        self.assertEqual(midi.fluidsynth_audio_args('pipewire', None),
+                         ['-a', 'pulseaudio'])
+        self.assertEqual(
+            midi.fluidsynth_audio_args('alsa', low),
+            ['-a', 'alsa', '-z', '128', '-c', '2', '-r', '48000'])
+        self.assertEqual(midi.fluidsynth_audio_args('jack', low),
+                         ['-a', 'jack', '-j', '-z', '128', '-c', '2'])
+
+    def test_timidity_args(self):
+        low = midi.LATENCY_PROFILES['low']
+        self.assertEqual(midi.timidity_audio_args('jack', None), ['-Oj'])
+        self.assertEqual(midi.timidity_audio_args('jack', low),
+                         ['-Oj', '-B2,8'])
+        self.assertEqual(midi.timidity_audio_args('pipewire', low),
+                         ['-Os', '-B2,8', '-s', '48000'])
+
+    def test_env(self):
+        low = midi.LATENCY_PROFILES['low']
+        env = midi.audio_env('pipewire', low)
+        self.assertEqual(env['PULSE_LATENCY_MSEC'], '10')
+        self.assertNotIn('PULSE_LATENCY_MSEC', midi.audio_env('alsa', low))
+
+
+class FakeFluidSynthShell(socketserver.StreamRequestHandler):
+    """Imitates FluidSynth shell server, one soundfont per 'load'."""
+
+    fonts = {}
+
+    def handle(self):
+        for line in self.rfile:
+            cmd, _, arg = line.decode('utf-8').strip().partition(' ')
+            out = ''
+            if cmd == 'fonts':
+                out = 'ID  Name\n'
+                for sfont_id, path in sorted(self.fonts.items()):
+                    out += '{0:3}  {1}\n'.format(sfont_id, path)
+            elif cmd == 'load' and arg.endswith('.sf2'):
+                sfont_id = max(self.fonts, default=0) + 1
+                self.fonts[sfont_id] = arg
+                out = 'loaded SoundFont has ID {0}\n'.format(sfont_id)
+            elif cmd == 'load':
+                out = 'failed to load the SoundFont\n'
+            elif cmd == 'unload':
+                del self.fonts[int(arg)]
+            elif cmd == 'echo':
+                out = arg + '\n'
+            self.wfile.write(out.encode('utf-8'))
+
+
+class TestFluidSynthShell(unittest.TestCase):
+
+    def setUp(self):
+        FakeFluidSynthShell.fonts = {1: '/usr/share/sf2/FluidR3_GM.sf2'}
+        self.server = socketserver.TCPServer(('127.0.0.1', 0),
+                                             FakeFluidSynthShell)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.shell = midi.FluidSynthShell(self.server.server_address[1],
+                                          timeout=5)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_fonts(self):
+        self.assertEqual(self.shell.fonts(), [1])
+
+    def test_load(self):
+        self.assertEqual(self.shell.load('/tmp/test.sf2'), 2)
+        self.assertIsNone(self.shell.load('/tmp/test.txt'))
+        self.assertIsNone(self.shell.load('test.sf2'))
+        self.assertIsNone(self.shell.load('/tmp/with space.sf2'))
+
+    def test_swap(self):
+        self.assertTrue(self.shell.swap_soundfont('/tmp/test.sf2'))
+        self.assertEqual(FakeFluidSynthShell.fonts, {2: '/tmp/test.sf2'})
+        self.assertFalse(self.shell.swap_soundfont('/tmp/test.txt'))
+        self.assertEqual(FakeFluidSynthShell.fonts, {2: '/tmp/test.sf2'})
+
+    def test_shared_synth_switch(self):
+        synth = subprocess.Popen(['sleep', '60'])
+        while not midi.process_alive(synth.pid, 'sleep'):
+            time.sleep(0.01)  # wait for exec
+        port = midi.MidiPort('128:0', 'FLUID Synth', 'Synth input port',
+                             'User', '-We-')
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+             unittest.mock.patch('xdg.RUNTIME_DIR', tmp_dir), \
+             unittest.mock.patch('midi.list_alsa_sequencer_ports',
+                                 return_value=[port]):
+            shared = midi.SharedSynth()
+            shared.register(synth.pid, 'sleep', '/tmp/old.sf2', port,
+                            self.shell.port)
+            self.assertEqual(shared.reuse('/tmp/test.sf2'), port)
+            self.assertEqual(shared.load()['sfont'], '/tmp/test.sf2')
+            shared.release()  # keep_alive is 0 by default
+        self.assertEqual(synth.wait(timeout=5), -15)
+        self.assertEqual(FakeFluidSynthShell.fonts, {2: '/tmp/test.sf2'})
+
+    def test_detect_switch(self):
+        synth = subprocess.Popen(['sleep', '60'])
+        while not midi.process_alive(synth.pid, 'sleep'):
+            time.sleep(0.01)  # wait for exec
+        port = midi.MidiPort('128:0', 'FLUID Synth', 'Synth input port',
+                             'User', '-We-')
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+             unittest.mock.patch('xdg.RUNTIME_DIR', tmp_dir), \
+             unittest.mock.patch('midi.SHARED_SYNTH', midi.SharedSynth()), \
+             unittest.mock.patch('midi.find_midi_port', return_value=port), \
+             unittest.mock.patch('midi.list_alsa_sequencer_ports',
+                                 return_value=[port]), \
+             unittest.mock.patch.object(midi.settings, 'get_midi_sequencer',
+                                        return_value=''), \
+             unittest.mock.patch.object(midi.settings, 'get_midi_soundfont',
+                                        return_value='/tmp/test.sf2'):
+            midi.SHARED_SYNTH.register(synth.pid, 'sleep', '/tmp/old.sf2',
+                                       port, self.shell.port)
+            self.assertEqual(midi.detect_external_synth(), port)
+            self.assertEqual(midi.SHARED_SYNTH.load()['sfont'],
+                             '/tmp/test.sf2')
+            midi.SHARED_SYNTH.release()  # keep_alive is 0 by default
+        self.assertEqual(synth.wait(timeout=5), -15)
+        self.assertEqual(FakeFluidSynthShell.fonts, {2: '/tmp/test.sf2'})
+
+
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+# Copyright (C) 2019-2021  Patryk Obara <patryk.obara@gmail.com>
+
+# pylint: disable=missing-docstring
+# pylint: disable=wrong-spelling-in-comment
+
+import threading
+import unittest
+
+from scheduler import TaskGraph
+
+
+class TestTaskGraph(unittest.TestCase):
+
+    def test_dependencies(self):
+        done = []
+        with TaskGraph() as tasks:
+            tasks.add('a', done.append, 'a')
+            tasks.add('b', done.append, 'b', deps=['a'])
+            tasks.add('c', done.append, 'c', deps=['a', 'b'])
+            tasks.wait()
+        self.assertEqual(done, ['a', 'b', 'c'])
+
+    def test_pass_results(self):
+        with TaskGraph() as tasks:
+            tasks.add('a', int, '2')
+            tasks.add('b', int, '3')
+            tasks.add('c', pow, deps=['a', 'b'], pass_results=True)
+            tasks.add('d', str, 1, deps=['a'])
+            self.assertEqual(tasks.pop('c'), 8)
+            self.assertEqual(tasks.pop('d'), '1')
+
+    def test_concurrent(self):
+        # Both tasks need to run at the same time to pass the barrier.
+        barrier = threading.Barrier(2, timeout=5)
+        with TaskGraph() as tasks:
+            tasks.add('x', barrier.wait)
+            tasks.add('y', barrier.wait)
+            self.assertEqual({tasks.pop('x'), tasks.pop('y')}, {0, 1})
+
+    def test_pop(self):
+        with TaskGraph() as tasks:
+            tasks.add('x', lambda: 42)
+            self.assertEqual(tasks.pop('x', lambda: 0), 42)
+            self.assertEqual(tasks.pop('x', lambda: 0), 0)
+            self.assertIsNone(tasks.pop('y'))
+
+    def test_failure(self):
+        with TaskGraph() as tasks:
+            tasks.add('x', int, 'not a number')
+            tasks.add('y', int, '1', deps=['x'])
+            with self.assertRaises(ValueError):
+                tasks.pop('y')
+            with self.assertRaises(ValueError):
+                tasks.wait()
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
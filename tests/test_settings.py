@@ -7,8 +7,13 @@
 # pylint: disable=wrong-spelling-in-comment
 
 import os
+import tempfile
 import unittest
 
+from unittest import mock
+
+import settings as settings_module
+
 # Unit Tests are started with overriden XDG_CONFIG_HOME
 from settings import SETTINGS as settings, DEFAULT_DOSBOX_BINARY
 
@@ -76,6 +81,75 @@ class TestSettings(unittest.TestCase):
         seq = settings.get_midi_sequencer()
         self.assertEqual(seq, 'foobar')
 
+    def test_midi_startup_timeout(self):
+        self.assertEqual(settings.get_midi_startup_timeout(), 5.0)
+        settings.store.set('midi', 'startup_timeout', 'soon')
+        self.assertEqual(settings.get_midi_startup_timeout(), 5.0)
+        settings.store.set('midi', 'startup_timeout', '0.5')
+        self.assertEqual(settings.get_midi_startup_timeout(), 0.5)
+        settings.store.remove_option('midi', 'startup_timeout')
+
+    def test_midi_latency(self):
+        self.assertEqual(settings.get_midi_latency(), 'medium')
+        settings.store.set('midi', 'latency', 'Low')
+        self.assertEqual(settings.get_midi_latency(), 'low')
+        settings.store.set('midi', 'latency', 'none')
+        self.assertEqual(settings.get_midi_latency(), 'medium')
+        settings.store.remove_option('midi', 'latency')
+
+
+class TestSoundfontCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.sf2_dir = os.path.join(self.tmp_dir.name, 'data', 'soundfonts')
+        os.makedirs(self.sf2_dir)
+        self.sf2 = os.path.join(self.sf2_dir, 'test.sf2')
+        with open(self.sf2, 'w'):
+            pass
+        self.patches = [
+            mock.patch('xdg.CACHE_HOME', os.path.join(self.tmp_dir.name,
+                                                      'cache')),
+            mock.patch('xdg.DATA_HOME', os.path.join(self.tmp_dir.name,
+                                                     'data')),
+            mock.patch('xdg.DATA_DIRS', []),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.tmp_dir.cleanup()
+
+    def find_soundfont(self):
+        conf = settings_module.Settings()
+        conf.store.set('midi', 'soundfont', 'test.sf2')
+        conf.__assure_sf2_exists__()
+        return conf.get_str('midi', 'soundfont', '')
+
+    def test_cache(self):
+        self.assertEqual(self.find_soundfont(), self.sf2)
+        with mock.patch('os.path.isfile', return_value=True) as isfile:
+            self.assertEqual(self.find_soundfont(), self.sf2)
+            isfile.assert_called_once_with(self.sf2)
+
+    def test_cached_file_removed(self):
+        self.assertEqual(self.find_soundfont(), self.sf2)
+        os.remove(self.sf2)
+        self.assertEqual(self.find_soundfont(), '')
+
+    def test_unusable_cache_dir(self):
+        with mock.patch('xdg.CACHE_HOME', self.sf2):  # not a directory
+            self.assertEqual(self.find_soundfont(), self.sf2)
+
+    def test_env_override(self):
+        other = os.path.join(self.sf2_dir, 'other.sf2')
+        with open(other, 'w'):
+            pass
+        with mock.patch.dict(os.environ, BOXTRON_SOUNDFONT='other.sf2'):
+            self.assertEqual(self.find_soundfont(), other)
+
 
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
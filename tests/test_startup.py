@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+# Copyright (C) 2019-2021  Patryk Obara <patryk.obara@gmail.com>
+
+# pylint: disable=missing-docstring
+# pylint: disable=wrong-spelling-in-comment
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# Modules needed only to actually launch a game.
+#
+HEAVY_MODULES = [
+    'confgen',
+    'ctypes',
+    'midi',
+    'preconfig',
+    'settings',
+    'tarfile',
+    'tweaks',
+    'urllib.request',
+    'xlib',
+    'zipfile',
+]
+
+# Total time of all imports (in microseconds), including the ones done
+# by the interpreter itself; generous, to avoid failing on slow machines.
+#
+IMPORT_TIME_BUDGET_US = 300000
+
+
+def import_times(args, env):
+    """Run run-dosbox and return dict of module import times."""
+    cmd = [sys.executable, '-X', 'importtime', 'run-dosbox'] + args
+    proc = subprocess.run(cmd,
+                          env=env,
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE,
+                          check=True,
+                          universal_newlines=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(self_us)
+    return times
+
+
+class TestStartup(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.env = dict(os.environ,
+                        XDG_CONFIG_HOME=self.tmp_dir.name,
+                        XDG_RUNTIME_DIR=self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_version(self):
+        times = import_times(['--version'], self.env)
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, times)
+        self.assertLess(sum(times.values()), IMPORT_TIME_BUDGET_US)
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+    def test_current_step(self):
+        args = ['iscriptevaluator.exe', '--get-current-step', '1234']
+        times = import_times(args, self.env)
+        for module in HEAVY_MODULES + ['argparse', 'fakescripteval']:
+            self.assertNotIn(module, times)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
@@ -7,6 +7,7 @@
 # pylint: disable=wrong-spelling-in-comment
 
 import os
+import tempfile
 import unittest
 
 import toolbox
@@ -298,5 +299,52 @@ class TestGameId(unittest.TestCase):
         self.assertEqual('gog:9090909', toolbox.get_game_global_id())
 
 
+class TestPageCache(unittest.TestCase):
+
+    def test_residency(self):
+        with tempfile.NamedTemporaryFile() as tmp_file:
+            self.assertIsNone(toolbox.page_cache_residency(tmp_file.name))
+            tmp_file.write(b'x' * 3 * 4096)
+            tmp_file.flush()
+            resident = toolbox.page_cache_residency(tmp_file.name)
+            self.assertGreaterEqual(resident, 0)
+            self.assertLessEqual(resident, 1)
+            toolbox.prefetch_file(tmp_file.name)
+
+    def test_missing_file(self):
+        self.assertIsNone(toolbox.page_cache_residency('/nonexistent.sf2'))
+        toolbox.prefetch_file('/nonexistent.sf2')
+
+
+class TestWriteAtomically(unittest.TestCase):
+
+    def test_write(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'sub', 'file.json')
+            self.assertTrue(toolbox.write_atomically(path, 'abc'))
+            self.assertTrue(toolbox.write_atomically(path, 'def'))
+            with open(path, 'r') as file:
+                self.assertEqual(file.read(), 'def')
+            self.assertEqual(os.listdir(os.path.dirname(path)), ['file.json'])
+
+    def test_planted_link(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'file.json')
+            target = os.path.join(tmp_dir, 'target')
+            with open(target, 'w') as file:
+                file.write('target')
+            os.symlink(target, '{}.{}.tmp'.format(path, os.getpid()))
+            self.assertTrue(toolbox.write_atomically(path, 'abc'))
+            with open(target, 'r') as file:
+                self.assertEqual(file.read(), 'target')
+            with open(path, 'r') as file:
+                self.assertEqual(file.read(), 'abc')
+
+    def test_unusable_dir(self):
+        with tempfile.NamedTemporaryFile() as not_a_dir:
+            path = os.path.join(not_a_dir.name, 'file.json')
+            self.assertFalse(toolbox.write_atomically(path, 'abc'))
+
+
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
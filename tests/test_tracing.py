@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+# Copyright (C) 2019-2021  Patryk Obara <patryk.obara@gmail.com>
+
+# pylint: disable=missing-docstring
+# pylint: disable=wrong-spelling-in-comment
+
+import json
+import os
+import pstats
+import tempfile
+import unittest
+
+from unittest import mock
+
+import tracing
+import xdg
+
+
+@tracing.traced
+def traced_function(value):
+    return value * 2
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.original_cache_home = xdg.CACHE_HOME
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        xdg.CACHE_HOME = self.tmp_dir.name
+        del tracing.EVENTS[:]
+
+    def tearDown(self):
+        xdg.CACHE_HOME = self.original_cache_home
+        self.tmp_dir.cleanup()
+        del tracing.EVENTS[:]
+
+    def test_disabled(self):
+        with mock.patch('tracing.ENABLED', False):
+            with tracing.span('phase'):
+                pass
+            self.assertEqual(traced_function(2), 4)
+            self.assertIsNone(tracing.write_trace())
+        self.assertEqual(tracing.EVENTS, [])
+
+    def test_spans(self):
+        with mock.patch('tracing.ENABLED', True):
+            with tracing.span('phase'):
+                self.assertEqual(traced_function(2), 4)
+            name = tracing.write_trace()
+            self.assertIsNone(tracing.write_trace())
+        with open(name, 'r') as trace:
+            events = json.load(trace)['traceEvents']
+        names = [event['name'] for event in events]
+        self.assertEqual(names, [
+            'test_tracing.traced_function',
+            'phase',
+            'launch',
+        ])
+        inner, outer = events[0], events[1]
+        self.assertTrue(all(event['ph'] == 'X' for event in events))
+        self.assertGreaterEqual(inner['ts'], outer['ts'])
+        self.assertLessEqual(inner['dur'], outer['dur'])
+
+    def test_unusable_cache_dir(self):
+        xdg.CACHE_HOME = __file__  # not a directory
+        with mock.patch('tracing.ENABLED', True):
+            with tracing.span('phase'):
+                pass
+            self.assertIsNone(tracing.write_trace())
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.original_cache_home = xdg.CACHE_HOME
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        xdg.CACHE_HOME = self.tmp_dir.name
+
+    def tearDown(self):
+        xdg.CACHE_HOME = self.original_cache_home
+        self.tmp_dir.cleanup()
+
+    def test_profile(self):
+        stats_file = xdg.cache_path(tracing.PROFILE_STATS_FILE)
+        profiler = tracing.Profiler()
+        profiler.stop()
+        self.assertFalse(os.path.exists(stats_file))
+        profiler.start()
+        traced_function([0] * 1000)
+        profiler.stop()
+        stats = pstats.Stats(stats_file)
+        functions = [func for _, _, func in stats.stats]
+        self.assertIn('traced_function', functions)
+        with open(xdg.cache_path(tracing.PROFILE_ALLOC_FILE), 'r') as alloc:
+            self.assertTrue(alloc.readline().startswith('current:'))
+
+    def test_unusable_cache_dir(self):
+        xdg.CACHE_HOME = __file__  # not a directory
+        profiler = tracing.Profiler()
+        profiler.start()
+        traced_function(2)
+        profiler.stop()
+        self.assertIsNone(profiler.profile)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
@@ -7,9 +7,15 @@
 # pylint: disable=wrong-spelling-in-comment
 
 import os
+import tempfile
 import unittest
 
-from winpathlib import to_posix_path
+from unittest import mock
+
+import winpathlib
+import xdg
+
+from winpathlib import resolve_many, to_posix_path
 
 
 class TestPathConversion(unittest.TestCase):
@@ -91,6 +97,145 @@ class TestPathConversion(unittest.TestCase):
         with self.assertRaises(FileNotFoundError):
             to_posix_path(win_path, strict=True)
 
+    def test_ambiguous_path_both_candidates(self):
+        win_path = 'tests\\files\\CASE\\a\\B\\file'
+        with self.assertRaises(FileNotFoundError) as ctx:
+            to_posix_path(win_path)
+        self.assertIn('tests/files/case/A/b/file', str(ctx.exception))
+        self.assertIn('tests/files/case/a/B/file', str(ctx.exception))
+
+
+class TestShortNames(unittest.TestCase):
+
+    def test_short_path(self):
+        path = 'tests/files/somewhat_long_path/'
+        file = 'With Much Much Longer Path Inside ' + \
+               'AbcDefGhiJklMnoPqrStuVwxYz_0123456789.tXt'
+        win_path = 'TESTS\\FILES\\SOMEWH~1\\WITHMU~1.TXT'
+        self.assertEqual(to_posix_path(win_path), path + file)
+
+    def test_short_path_missing(self):
+        self.assertIsNone(to_posix_path('tests\\files\\SOMEWH~2'))
+
+    def test_numbering(self):
+        names = winpathlib.dos_short_names(['Program Files (x86)',
+                                            'PROGRA~1',
+                                            'Program Files',
+                                            'readme.txt',
+                                            'a.b.c'])
+        self.assertEqual(names, {'progra~2': 'Program Files',
+                                 'progra~3': 'Program Files (x86)',
+                                 'ab~1.c': 'a.b.c'})
+
+    def test_numbering_above_9(self):
+        names = winpathlib.dos_short_names(
+            ['Long Name {:02}'.format(i) for i in range(10)])
+        self.assertEqual(names['longna~9'], 'Long Name 08')
+        self.assertEqual(names['longn~10'], 'Long Name 09')
+
+
+class TestResolveMany(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertEqual(resolve_many([]), {})
+
+    def test_same_as_single_paths(self):
+        win_paths = [
+            '',
+            '.',
+            '..',
+            '.\\..',
+            'TeStS',
+            'TESTS\\FILES\\CONFS\\ABC\\DEF\\FILE',
+            'tests\\files\\case\\dosbox.conf',
+            'tests\\files\\..\\files\\.\\.\\case\\dosbox.conf',
+            'tests\\files\\case\\dosbox.confz',
+            'tests_XXX\\files\\case\\dosbox.confz',
+            'tests\\files\\CASE\\a\\B\\c',
+        ]
+        expected = {p: to_posix_path(p) for p in win_paths}
+        self.assertEqual(resolve_many(win_paths), expected)
+
+    def test_ambiguous_path_lenient(self):
+        win_path = 'tests\\files\\CASE\\a\\B\\file'
+        paths = resolve_many([win_path, 'tests'], strict=False)
+        self.assertIn(paths[win_path], ('tests/files/case/A/b/file',
+                                        'tests/files/case/a/B/file'))
+        self.assertEqual(paths['tests'], 'tests')
+
+    def test_ambiguous_path_strict(self):
+        win_path = 'tests\\files\\CASE\\a\\B\\file'
+        with self.assertRaises(FileNotFoundError):
+            resolve_many(['tests', win_path])
+
+
+class TestDirectoryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.original_dir = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        os.mkdir('Dir')
+        open('Dir/File.txt', 'w').close()
+        os.utime('Dir', ns=(10**9, 10**9))
+        os.utime('.', ns=(10**9, 10**9))
+        winpathlib.clear_cache()
+
+    def tearDown(self):
+        os.chdir(self.original_dir)
+        self.tmp_dir.cleanup()
+        winpathlib.clear_cache()
+
+    def test_listing_reused(self):
+        self.assertEqual(to_posix_path('DIR\\FILE.TXT'), 'Dir/File.txt')
+        cached = winpathlib.directory_index(os.path.abspath('Dir'))
+        self.assertEqual(to_posix_path('dir\\file.txt'), 'Dir/File.txt')
+        self.assertIs(winpathlib.directory_index(os.path.abspath('Dir')),
+                      cached)
+
+    def test_listing_invalidated(self):
+        self.assertIsNone(to_posix_path('DIR\\OTHER.TXT'))
+        open('Dir/Other.txt', 'w').close()
+        os.utime('Dir', ns=(2 * 10**9, 2 * 10**9))
+        self.assertEqual(to_posix_path('DIR\\OTHER.TXT'), 'Dir/Other.txt')
+
+    def test_persistent_index(self):
+        original_cache_home = xdg.CACHE_HOME
+        with tempfile.TemporaryDirectory() as cache_home:
+            xdg.CACHE_HOME = cache_home
+            try:
+                install_dir = os.getcwd()
+                self.assertEqual(to_posix_path('DIR\\FILE.TXT'),
+                                 'Dir/File.txt')
+                winpathlib.save_index(install_dir)
+                winpathlib.clear_cache()
+                winpathlib.load_index(install_dir)
+                with mock.patch('os.listdir', side_effect=AssertionError):
+                    self.assertEqual(to_posix_path('dir\\file.txt'),
+                                     'Dir/File.txt')
+            finally:
+                xdg.CACHE_HOME = original_cache_home
+
+    def test_unusable_cache_dir(self):
+        with tempfile.NamedTemporaryFile() as not_a_dir, \
+             mock.patch('xdg.CACHE_HOME', not_a_dir.name):
+            self.assertEqual(to_posix_path('DIR\\FILE.TXT'), 'Dir/File.txt')
+            winpathlib.save_index(os.getcwd())
+            self.assertEqual(winpathlib.PERSISTED, {})
+
+    def test_recent_listing_listed_once(self):
+        for name in ('A.txt', 'B.txt', 'C.txt'):
+            open(name, 'w').close()
+        with mock.patch('os.listdir', wraps=os.listdir) as listdir:
+            paths = resolve_many(['a.txt', 'b.txt', 'c.txt', 'dir'])
+        self.assertEqual(listdir.call_count, 1)
+        self.assertEqual(paths['b.txt'], 'B.txt')
+
+    def test_recent_listing_not_cached(self):
+        os.utime('Dir')
+        self.assertEqual(to_posix_path('DIR\\FILE.TXT'), 'Dir/File.txt')
+        self.assertNotIn(os.path.abspath('Dir'), winpathlib.DIR_CACHE)
+
 
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
@@ -6,10 +6,24 @@
 # pylint: disable=missing-docstring
 # pylint: disable=wrong-spelling-in-comment
 
+import ctypes.util
+import os
+import shutil
+import subprocess
+import time
 import unittest
 
+from unittest import mock
+
 import xlib
 
+XVFB_DISPLAY = ':97'
+
+
+def xvfb_available():
+    return shutil.which('Xvfb') and ctypes.util.find_library('Xinerama') \
+        and ctypes.util.find_library('Xrandr')
+
 
 class TestXlib(unittest.TestCase):
 
@@ -20,5 +34,61 @@ class TestXlib(unittest.TestCase):
         self.assertEqual(screens.__class__, dict)
 
 
+class TestRefreshRate(unittest.TestCase):
+
+    def test_vga_mode(self):
+        # 720x400 text mode: 28.322 MHz, 900 x 449 total
+        mode = xlib.XRRModeInfo(dotClock=28322000, hTotal=900, vTotal=449)
+        self.assertAlmostEqual(xlib.mode_refresh_rate(mode), 70.087, 3)
+
+    def test_mode_flags(self):
+        mode = xlib.XRRModeInfo(dotClock=6000000,
+                                hTotal=1000,
+                                vTotal=100,
+                                modeFlags=xlib.RR_DOUBLE_SCAN)
+        self.assertEqual(xlib.mode_refresh_rate(mode), 30.0)
+        mode = xlib.XRRModeInfo(dotClock=6000000,
+                                hTotal=1000,
+                                vTotal=100,
+                                modeFlags=xlib.RR_INTERLACE)
+        self.assertEqual(xlib.mode_refresh_rate(mode), 120.0)
+
+    def test_unknown(self):
+        self.assertIsNone(xlib.mode_refresh_rate(xlib.XRRModeInfo()))
+
+
+@unittest.skipUnless(xvfb_available(), 'needs Xvfb, libXinerama, libXrandr')
+class TestXvfb(unittest.TestCase):
+
+    def setUp(self):
+        cmd = ['Xvfb', XVFB_DISPLAY, '-screen', '0', '1024x768x24']
+        self.xvfb = subprocess.Popen(cmd + ['+extension', 'RANDR'],
+                                     stderr=subprocess.DEVNULL)
+        socket = '/tmp/.X11-unix/X' + XVFB_DISPLAY[1:]
+        deadline = time.monotonic() + 5
+        while not os.path.exists(socket) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.env = mock.patch.dict(os.environ, DISPLAY=XVFB_DISPLAY)
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        self.xvfb.terminate()
+        self.xvfb.wait()
+
+    def test_outputs(self):
+        dpy = xlib.Xlib()
+        self.assertTrue(dpy.open_display())
+        outputs = xlib.query_outputs(dpy)
+        dpy.close_display()
+        self.assertEqual([o[1:5] for o in outputs], [(1024, 768, 0, 0)])
+        self.assertGreater(outputs[0].refresh, 0)
+
+    def test_screens(self):
+        screen = xlib.query_screens()['0']
+        self.assertEqual((screen.width, screen.height), (1024, 768))
+        self.assertGreater(screen.refresh, 0)
+
+
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
@@ -11,11 +11,10 @@ import pathlib
 import re
 import shlex
 import subprocess
-import zipfile
 from typing import List, Optional, Tuple
 
 import winpathlib
-from log import log_err
+from log import log, log_err
 
 
 def enabled_in_env(var: str, fallback_var=None) -> bool:
@@ -202,6 +201,17 @@ def guess_game_install_dir(directory=None):
     This function assumes current working directory is a sub-directory
     of an installation directory.
     """
+    found_path = find_game_install_dir(directory)
+    if not found_path:
+        return None
+    return found_path.replace(' ', r'\ ').replace('&', r'\&')
+
+
+def find_game_install_dir(directory=None):
+    """Return absolute path pointing to game installation directory.
+
+    Works just like guess_game_install_dir, but the path is not escaped.
+    """
     path = directory or os.getcwd()
     posix_path = pathlib.PurePosixPath(path)
     assert posix_path.is_absolute()
@@ -222,8 +232,7 @@ def guess_game_install_dir(directory=None):
     if not lib_pattern_found:
         return None
     # TODO ensure that we're joining at least one part in line below
-    found_path = os.path.join('', *posix_parts[:pos + 1])
-    return found_path.replace(' ', r'\ ').replace('&', r'\&')
+    return os.path.join('', *posix_parts[:pos + 1])
 
 
 class PidFile:
@@ -246,6 +255,7 @@ class PidFile:
 
 def unzip(src_file, dst_dir):
     """Simply unzip a file."""
+    import zipfile  # pylint: disable=import-outside-toplevel
     with zipfile.ZipFile(src_file, 'r') as archive:
         archive.extractall(dst_dir)
 
@@ -259,6 +269,88 @@ def sha256sum(path):
     return algo.hexdigest()
 
 
+def page_cache_residency(path):
+    """Return fraction of file pages present in page cache.
+
+    Return None if it can't be determined.
+    """
+    # pylint: disable=import-outside-toplevel
+    import ctypes
+    import mmap
+    try:
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if size == 0:
+                return None
+            # Private mapping is needed only because ctypes can't take
+            # address of a read-only buffer; it's never written to.
+            with mmap.mmap(file.fileno(), size,
+                           access=mmap.ACCESS_COPY) as mapping:
+                buf = ctypes.c_char.from_buffer(mapping)
+                addr = ctypes.addressof(buf)
+                del buf
+                pages = (size + mmap.PAGESIZE - 1) // mmap.PAGESIZE
+                vec = (ctypes.c_ubyte * pages)()
+                libc = ctypes.CDLL(None, use_errno=True)
+                libc.mincore.argtypes = [
+                    ctypes.c_void_p, ctypes.c_size_t, ctypes.c_void_p
+                ]
+                if libc.mincore(addr, size, vec) != 0:
+                    return None
+                # Only the lowest bit tells if page is resident; other
+                # bits are reserved.
+                return sum(page & 1 for page in vec) / pages
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def prefetch_file(path):
+    """Ask the kernel to start reading a file into page cache."""
+    resident = page_cache_residency(path)
+    if resident is not None:
+        log('{:.0%} of {} is already in page cache'.format(resident, path))
+    if resident == 1.0 or not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+    except OSError as err:
+        log_err('prefetching', path, 'failed:', err)
+
+
+def write_atomically(path, content):
+    """Replace contents of a text file, so readers never see a partial file.
+
+    Missing directories are created (accessible only to the user).
+    Temporary file is always a new file, never a link planted in its place.
+    Used for caches and state files, which must never prevent a game from
+    starting, so failure is logged instead of raised.  Return True on
+    success.
+    """
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW
+    try:
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        try:
+            os.remove(tmp_path)  # left by a crashed process with same pid
+        except FileNotFoundError:
+            pass
+        with os.fdopen(os.open(tmp_path, flags, 0o600), 'w') as file:
+            file.write(content)
+        os.replace(tmp_path, path)
+        return True
+    except OSError as err:
+        log_err('writing', path, 'failed:', err)
+    try:
+        os.remove(tmp_path)
+    except OSError:
+        pass
+    return False
+
+
 def get_lines(txt_file):
     """Simply get list of lines."""
     with open(txt_file) as tfile:
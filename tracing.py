@@ -0,0 +1,161 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# Copyright (C) 2019-2021  Patryk Obara <patryk.obara@gmail.com>
+
+"""
+Tracing and profiling of launch phases.
+
+Set BOXTRON_TRACE=1 to record time spent in each phase of a launch.
+Trace is saved in Chrome trace event format (open it in chrome://tracing
+or https://ui.perfetto.dev/) in Boxtron's cache dir.
+
+Set BOXTRON_PROFILE=1 (or use run-dosbox --profile) to run the launch
+under cProfile and tracemalloc.  Results are saved in Boxtron's cache dir
+too (game directory is often read-only).
+"""
+
+import atexit
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+import xdg
+
+from log import log, log_err
+
+ENABLED: bool = os.environ.get('BOXTRON_TRACE', '0') not in ('', '0')
+
+PROFILE: bool = os.environ.get('BOXTRON_PROFILE', '0') not in ('', '0')
+
+PROFILE_STATS_FILE = 'boxtron_profile.pstats'
+
+PROFILE_ALLOC_FILE = 'boxtron_profile_alloc.txt'
+
+PROFILE_ALLOC_TOP = 30
+
+START_NS = time.monotonic_ns()
+
+EVENTS = []
+
+
+@contextlib.contextmanager
+def span(name):
+    """Record time spent inside a with block as a named span."""
+    if not ENABLED:
+        yield
+        return
+    start = time.monotonic_ns()
+    try:
+        yield
+    finally:
+        end = time.monotonic_ns()
+        EVENTS.append({
+            'name': name,
+            'cat': 'boxtron',
+            'ph': 'X',
+            'ts': (start - START_NS) // 1000,
+            'dur': (end - start) // 1000,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+        })
+
+
+def traced(func):
+    """Decorator recording each call of a function as a span."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with span(func.__module__ + '.' + func.__qualname__):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def write_trace():
+    """Save recorded spans to a file in cache dir.
+
+    Spans recorded after this call are saved on the next call.
+    """
+    if not ENABLED or not EVENTS:
+        return None
+    events = EVENTS[:]
+    del EVENTS[:len(events)]
+    events.append({
+        'name': 'launch',
+        'cat': 'boxtron',
+        'ph': 'X',
+        'ts': 0,
+        'dur': (time.monotonic_ns() - START_NS) // 1000,
+        'pid': os.getpid(),
+        'tid': threading.main_thread().ident,
+    })
+    name = xdg.cache_path('trace_{}_{}.json'.format(
+        time.strftime('%Y%m%d_%H%M%S'), os.getpid()))
+    try:
+        os.makedirs(os.path.dirname(name), exist_ok=True)
+        with open(name, 'w') as trace:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace)
+    except OSError as err:
+        log_err('saving launch trace failed:', err)
+        return None
+    log('launch trace saved to', name)
+    return name
+
+
+class Profiler:
+    """Function-level timings and memory allocations of a launch."""
+
+    def __init__(self):
+        self.profile = None
+
+    def start(self):
+        """Start collecting timings and allocations."""
+        if self.profile:
+            return
+        # Profiling modules are imported only when requested, so normal
+        # launches do not pay for it.
+        import cProfile  # pylint: disable=import-outside-toplevel
+        import tracemalloc  # pylint: disable=import-outside-toplevel
+        tracemalloc.start()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Stop profiling and save results in cache dir."""
+        if not self.profile:
+            return
+        import cProfile  # pylint: disable=import-outside-toplevel
+        import tracemalloc  # pylint: disable=import-outside-toplevel
+        profile, self.profile = self.profile, None
+        profile.disable()
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, cProfile.__file__),
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stats_file = xdg.cache_path(PROFILE_STATS_FILE)
+        alloc_file = xdg.cache_path(PROFILE_ALLOC_FILE)
+        try:
+            os.makedirs(os.path.dirname(stats_file), exist_ok=True)
+            profile.dump_stats(stats_file)
+            with open(alloc_file, 'w') as alloc:
+                alloc.write('current: {} B, peak: {} B\n'.format(
+                    current, peak))
+                alloc.write(
+                    'top {} allocation sites:\n'.format(PROFILE_ALLOC_TOP))
+                for stat in snapshot.statistics('lineno')[:PROFILE_ALLOC_TOP]:
+                    alloc.write('{}\n'.format(stat))
+        except OSError as err:
+            log_err('saving profile failed:', err)
+            return
+        log('profile saved to', stats_file, 'and', alloc_file)
+
+
+PROFILER = Profiler()
+
+if ENABLED:
+    atexit.register(write_trace)
@@ -15,7 +15,8 @@ import toolbox
 import xdg
 
 from log import log_err
-from winpathlib import to_posix_path
+from tracing import traced
+from winpathlib import resolve_many
 
 # There are several tweaks, that can be specified in TWEAKS_DB:
 #
@@ -376,6 +377,7 @@ def get_midi_preset(app_id):
 # broken path), then Boxtron and DOSBox are going to fail because .conf files
 # will not be in their expected location.
 #
+@traced
 def check_cwd(command_line):
     """Test if current working directory is appropriate to launch the game.
 
@@ -396,7 +398,7 @@ def check_cwd(command_line):
     conf_paths = (dbox_args.conf or [])
 
     def paths_found():
-        return all(to_posix_path(p, strict=False) for p in conf_paths)
+        return all(resolve_many(conf_paths, strict=False).values())
 
     if paths_found():
         return False, os.getcwd()
@@ -5,8 +5,194 @@
 Module providing conversion between DOS/Windows and Posix paths.
 """
 
+import hashlib
+import json
 import os
 import pathlib
+import re
+import time
+
+import xdg
+
+from tracing import traced
+
+# Characters allowed in DOS file names (besides letters and digits);
+# any other character is replaced with underscore in short names.
+#
+INVALID_DOS_CHARS = re.compile(r"[^A-Z0-9!#$%&'()@^_`{}~-]")
+
+# Directory listings younger than this are not cached; a file created
+# within the same timestamp tick as the listing would not change
+# the directory mtime, so such listing can't be validated later.
+#
+RACY_MTIME_NS = 2 * 10**9
+
+
+class DirectoryIndex:
+    """Case-insensitive index of names inside a single directory."""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, path, mtime_ns, listing=None):
+        self.mtime_ns = mtime_ns
+        self.listing = os.listdir(path) if listing is None else listing
+        self.names = {}
+        self.short_names = None
+        for name in self.listing:
+            self.names.setdefault(name.casefold(), []).append(name)
+
+    def lookup(self, name):
+        """Return list of names matching name case-insensitively.
+
+        DOS 8.3 short names (e.g. PROGRA~1) are matched as well, but only
+        if there's no file or directory with such long name.
+        """
+        found = self.names.get(name.casefold(), [])
+        if found or '~' not in name:
+            return found
+        if self.short_names is None:
+            self.short_names = dos_short_names(self.listing)
+        short = self.short_names.get(name.casefold())
+        return [short] if short else []
+
+
+def split_dos_name(name):
+    """Split file name into base name and extension the way DOS does."""
+    stripped = name.lstrip('.')
+    if '.' not in stripped:
+        return stripped, ''
+    base, ext = stripped.rsplit('.', 1)
+    return base, ext
+
+
+def is_dos_name(name):
+    """Test if name is a valid 8.3 name (ignoring the case)."""
+    base, ext = split_dos_name(name)
+    if name.startswith('.') or base.count('.') > 0:
+        return False
+    if not 1 <= len(base) <= 8 or len(ext) > 3:
+        return False
+    return not INVALID_DOS_CHARS.search((base + ext).upper())
+
+
+def dos_short_names(listing):
+    """Generate DOS 8.3 short names for names in a directory listing.
+
+    Names are numbered in sorted order, the same way DOSBox does it for
+    mounted directories (~1, ~2, …, ~10 with base name shortened to
+    make space for the number).
+
+    Return a dict mapping casefolded short name to the original name.
+    """
+    taken = {name.upper() for name in listing if is_dos_name(name)}
+    short_names = {}
+    for name in sorted(listing):
+        if is_dos_name(name):
+            continue
+        base, ext = split_dos_name(name)
+        base = re.sub(r'[ .]', '', base.upper())
+        base = INVALID_DOS_CHARS.sub('_', base) or '_'
+        ext = INVALID_DOS_CHARS.sub('_', ext.upper().replace(' ', ''))[:3]
+        num = 1
+        while True:
+            tail = '~{}'.format(num)
+            short = base[:8 - len(tail)] + tail + ('.' + ext if ext else '')
+            if short not in taken:
+                break
+            num += 1
+        taken.add(short)
+        short_names[short.casefold()] = name
+    return short_names
+
+
+DIR_CACHE = {}
+
+# Directories (and their mtimes) read from or written to the persistent
+# index during this run.
+#
+PERSISTED = {}
+
+
+def clear_cache():
+    """Forget all cached directory listings."""
+    DIR_CACHE.clear()
+    PERSISTED.clear()
+
+
+def directory_index(path):
+    """Return DirectoryIndex for an absolute path.
+
+    Listing is re-used for as long as mtime of the directory stays
+    the same.
+    """
+    mtime_ns = os.stat(path).st_mtime_ns
+    index = DIR_CACHE.get(path)
+    if index and index.mtime_ns == mtime_ns:
+        return index
+    index = DirectoryIndex(path, mtime_ns)
+    if time.time_ns() - mtime_ns > RACY_MTIME_NS:
+        DIR_CACHE[path] = index
+    else:
+        DIR_CACHE.pop(path, None)
+    return index
+
+
+def index_file(install_dir):
+    """Return path to the persistent index for an installation dir."""
+    uid = hashlib.sha1(install_dir.encode('utf-8')).hexdigest()[:12]
+    return xdg.cache_path('pathindex_{}.json'.format(uid))
+
+
+@traced
+def load_index(install_dir):
+    """Populate directory cache with listings stored on disk.
+
+    Stored listings are validated by directory mtime on use, just like
+    listings cached in memory.
+    """
+    try:
+        with open(index_file(install_dir), 'r') as index:
+            data = json.load(index)
+    except (OSError, ValueError):
+        return
+    if data.get('install_dir') != install_dir:
+        return
+    for path, (mtime_ns, listing) in data.get('dirs', {}).items():
+        if path not in DIR_CACHE:
+            DIR_CACHE[path] = DirectoryIndex(path, mtime_ns, listing)
+            PERSISTED[path] = mtime_ns
+
+
+@traced
+def save_index(install_dir):
+    """Store listings of directories inside install_dir on disk.
+
+    The file is re-written only if any listing changed since it was
+    loaded.
+    """
+    prefix = os.path.join(install_dir, '')
+    dirs = {
+        path: index
+        for path, index in DIR_CACHE.items()
+        if path == install_dir or path.startswith(prefix)
+    }
+    mtimes = {path: index.mtime_ns for path, index in dirs.items()}
+    if not dirs or mtimes == PERSISTED:
+        return
+    data = {
+        'install_dir': install_dir,
+        'dirs': {
+            path: [index.mtime_ns, index.listing]
+            for path, index in dirs.items()
+        },
+    }
+    # toolbox itself depends on this module
+    # pylint: disable=import-outside-toplevel,cyclic-import
+    import toolbox
+    if not toolbox.write_atomically(index_file(install_dir), json.dumps(data)):
+        return
+    PERSISTED.clear()
+    PERSISTED.update(mtimes)
 
 
 def to_posix_path(windows_path_str, *, strict=True):
@@ -23,7 +209,28 @@ def to_posix_path(windows_path_str, *, strict=True):
     if windows_path_str == '.':
         return '.'
     win_path = pathlib.PureWindowsPath(windows_path_str)
-    paths = __posix_paths_matching__(win_path.parts)
+    cwd = os.getcwd()
+
+    # Names colliding after casefolding are recorded in directory index,
+    # so as long as there's a single candidate for each part, path is
+    # not ambiguous and there's no need to look any further.
+    #
+    prefix = ''
+    for part in win_path.parts:
+        if part in ('.', '..'):
+            prefix = os.path.join(prefix, part)
+            continue
+        index = directory_index(os.path.join(cwd, prefix) if prefix else cwd)
+        candidates = index.lookup(part)
+        if not candidates:
+            return None
+        if len(candidates) > 1:
+            break
+        prefix = os.path.join(prefix, candidates[0])
+    else:
+        return prefix
+
+    paths = __posix_paths_matching__(cwd, win_path.parts)
     path_1 = next(paths, None)
     path_2 = next(paths, None)
     if strict and path_2 is not None:
@@ -33,15 +240,74 @@ def to_posix_path(windows_path_str, *, strict=True):
     return path_1
 
 
-def __posix_paths_matching__(parts):
+def __posix_paths_matching__(cwd, parts):
     if parts == ():
         yield ''
         return
     prefix_parts, last_part = parts[:-1], parts[-1]
-    for prefix in __posix_paths_matching__(prefix_parts):
+    for prefix in __posix_paths_matching__(cwd, prefix_parts):
         if last_part in ('.', '..'):
             yield os.path.join(prefix, last_part)
             continue
-        for candidate in os.listdir(prefix or '.'):
-            if candidate.casefold() == last_part.casefold():
-                yield os.path.join(prefix, candidate)
+        index = directory_index(os.path.join(cwd, prefix) if prefix else cwd)
+        for candidate in index.lookup(last_part):
+            yield os.path.join(prefix, candidate)
+
+
+def resolve_many(windows_paths, *, strict=True):
+    """Convert many case-insensitive paths to posix paths at once.
+
+    Works like to_posix_path, but all paths are arranged in a trie first,
+    so directories shared by several paths are looked up only once.
+
+    Return a dict mapping each windows path to posix path (or None).
+    If strict is set and any path is ambiguous, raise FileNotFoundError
+    describing all ambiguous paths.
+    """
+    cwd = os.getcwd()
+    unique_paths = list(dict.fromkeys(windows_paths))
+    trie = {}
+    for path_str in unique_paths:
+        if path_str == '.':
+            continue
+        node = trie
+        for part in pathlib.PureWindowsPath(path_str).parts:
+            node = node.setdefault(part.casefold(), {})
+        node.setdefault(None, []).append(path_str)
+
+    found = {}
+
+    def walk(node, prefix):
+        for path_str in node.get(None, []):
+            found.setdefault(path_str, []).append(prefix)
+        for part in ('.', '..'):
+            if part in node:
+                walk(node[part], os.path.join(prefix, part))
+        names = [part for part in node if part not in (None, '.', '..')]
+        if not names:
+            return
+        try:
+            index = directory_index(
+                os.path.join(cwd, prefix) if prefix else cwd)
+        except NotADirectoryError:
+            return
+        for part in names:
+            for candidate in index.lookup(part):
+                walk(node[part], os.path.join(prefix, candidate))
+
+    walk(trie, '')
+
+    ambiguous = [(path_str, paths) for path_str, paths in found.items()
+                 if len(paths) > 1]
+    if strict and ambiguous:
+        err = ' '.join("Windows path '{}' is ambiguous. "
+                       "It can be '{}' or '{}'.".format(
+                           pathlib.PureWindowsPath(path_str), *paths[:2])
+                       for path_str, paths in ambiguous)
+        raise FileNotFoundError(err)
+
+    found['.'] = ['.']
+    return {
+        path_str: (found[path_str][0] if path_str in found else None)
+        for path_str in unique_paths
+    }
@@ -18,6 +18,11 @@ CONF_HOME = os.environ.get('XDG_CONFIG_HOME') or \
 CACHE_HOME = os.environ.get('XDG_CACHE_HOME') or \
              os.path.expanduser('~/.cache')
 
+# Without XDG_RUNTIME_DIR, runtime files go to the user's own cache dir;
+# /tmp is shared with other users.
+#
+RUNTIME_DIR = os.environ.get('XDG_RUNTIME_DIR') or CACHE_HOME
+
 DATA_DIRS = os.environ.get('XDG_DATA_DIRS', '/usr/share').split(os.pathsep)
 
 
@@ -31,4 +36,20 @@ def get_data_dirs(include_data_home=True):
 def cached_file(name):
     """Obtain path to cached file in application specific dir."""
     os.makedirs(CACHE_HOME + '/boxtron', exist_ok=True)
+    return cache_path(name)
+
+
+def cache_path(name):
+    """Return path to cached file, without creating the directory."""
     return os.path.join(CACHE_HOME, 'boxtron', name)
+
+
+def runtime_file(name):
+    """Obtain path to runtime file in application specific dir."""
+    os.makedirs(RUNTIME_DIR + '/boxtron', mode=0o700, exist_ok=True)
+    return runtime_path(name)
+
+
+def runtime_path(name):
+    """Return path to runtime file, without creating the directory."""
+    return os.path.join(RUNTIME_DIR, 'boxtron', name)
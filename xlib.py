@@ -7,8 +7,14 @@ X11 related classes and functions.
 
 import collections
 
-from ctypes import c_bool, c_char_p, c_int, c_short, c_void_p, \
-                   CDLL, POINTER, Structure, byref
+from ctypes import c_bool, c_char_p, c_int, c_short, c_uint, c_ulong, \
+                   c_ushort, c_void_p, CDLL, POINTER, Structure, byref
+
+# XRRModeInfo.modeFlags values; see /usr/include/X11/extensions/randr.h
+#
+RR_INTERLACE = 0x10
+
+RR_DOUBLE_SCAN = 0x20
 
 
 class Xlib:
@@ -23,6 +29,8 @@ class Xlib:
         self.lib.XCloseDisplay.argtypes = [c_void_p]
         self.lib.XFree.argtypes = [c_void_p]
         self.lib.XFree.restype = c_int
+        self.lib.XDefaultRootWindow.argtypes = [c_void_p]
+        self.lib.XDefaultRootWindow.restype = c_ulong
         self.dpy = None
 
     def open_display(self):
@@ -48,6 +56,10 @@ class Xlib:
         """Adapts XDisplayString."""
         return self.lib.XDisplayString(self.dpy).decode('ascii')
 
+    def default_root_window(self):
+        """Adapts XDefaultRootWindow."""
+        return self.lib.XDefaultRootWindow(self.dpy)
+
 
 class XineramaScreenInfo(Structure):
     """struct XineramaScreenInfo
@@ -64,7 +76,8 @@ class XineramaScreenInfo(Structure):
                 ('height', c_short)]  # yapf: disable
 
 
-ScreenInfo = collections.namedtuple('ScreenInfo', 'number width height x y')
+ScreenInfo = collections.namedtuple('ScreenInfo',
+                                    'number width height x y refresh primary')
 
 
 class Xinerama:
@@ -96,20 +109,222 @@ class Xinerama:
         num = c_int(0)
         xscreens = self.lib.XineramaQueryScreens(dpy, byref(num))
         screens = [
-            ScreenInfo(s.screen_number, s.width, s.height, s.x_org, s.y_org)
-            for s in xscreens[:num.value]
+            ScreenInfo(s.screen_number, s.width, s.height, s.x_org, s.y_org,
+                       None, False) for s in xscreens[:num.value]
         ]
         self.xlib.free(xscreens)
         return screens
 
 
+class XRRModeInfo(Structure):
+    """struct XRRModeInfo
+
+    Definition in /usr/include/X11/extensions/Xrandr.h
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    _fields_ = [('id', c_ulong),
+                ('width', c_uint),
+                ('height', c_uint),
+                ('dotClock', c_ulong),
+                ('hSyncStart', c_uint),
+                ('hSyncEnd', c_uint),
+                ('hTotal', c_uint),
+                ('hSkew', c_uint),
+                ('vSyncStart', c_uint),
+                ('vSyncEnd', c_uint),
+                ('vTotal', c_uint),
+                ('name', c_char_p),
+                ('nameLength', c_uint),
+                ('modeFlags', c_ulong)]  # yapf: disable
+
+
+class XRRScreenResources(Structure):
+    """struct XRRScreenResources
+
+    Definition in /usr/include/X11/extensions/Xrandr.h
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    _fields_ = [('timestamp', c_ulong),
+                ('configTimestamp', c_ulong),
+                ('ncrtc', c_int),
+                ('crtcs', POINTER(c_ulong)),
+                ('noutput', c_int),
+                ('outputs', POINTER(c_ulong)),
+                ('nmode', c_int),
+                ('modes', POINTER(XRRModeInfo))]  # yapf: disable
+
+
+class XRROutputInfo(Structure):
+    """struct XRROutputInfo
+
+    Definition in /usr/include/X11/extensions/Xrandr.h
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    _fields_ = [('timestamp', c_ulong),
+                ('crtc', c_ulong),
+                ('name', c_char_p),
+                ('nameLen', c_int),
+                ('mm_width', c_ulong),
+                ('mm_height', c_ulong),
+                ('connection', c_ushort),
+                ('subpixel_order', c_ushort),
+                ('ncrtc', c_int),
+                ('crtcs', POINTER(c_ulong)),
+                ('nclone', c_int),
+                ('clones', POINTER(c_ulong)),
+                ('nmode', c_int),
+                ('npreferred', c_int),
+                ('modes', POINTER(c_ulong))]  # yapf: disable
+
+
+class XRRCrtcInfo(Structure):
+    """struct XRRCrtcInfo
+
+    Definition in /usr/include/X11/extensions/Xrandr.h
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    _fields_ = [('timestamp', c_ulong),
+                ('x', c_int),
+                ('y', c_int),
+                ('width', c_uint),
+                ('height', c_uint),
+                ('mode', c_ulong),
+                ('rotation', c_ushort),
+                ('noutput', c_int),
+                ('outputs', POINTER(c_ulong)),
+                ('rotations', c_ushort),
+                ('npossible', c_int),
+                ('possible', POINTER(c_ulong))]  # yapf: disable
+
+
+OutputInfo = collections.namedtuple('OutputInfo',
+                                    'name width height x y refresh primary')
+
+
+def mode_refresh_rate(mode):
+    """Return refresh rate (in Hz) of XRRModeInfo or None."""
+    v_total = mode.vTotal
+    if mode.modeFlags & RR_DOUBLE_SCAN:
+        v_total *= 2
+    if mode.modeFlags & RR_INTERLACE:
+        v_total /= 2
+    if not mode.hTotal or not v_total:
+        return None
+    return mode.dotClock / (mode.hTotal * v_total)
+
+
+class Xrandr:
+    """Adapter to X Resize and Rotate extension."""
+
+    def __init__(self, xlib):
+        self.xlib = xlib
+        self.lib = CDLL("libXrandr.so.2")
+        self.lib.XRRQueryExtension.argtypes = [
+            c_void_p, POINTER(c_int), POINTER(c_int)
+        ]
+        self.lib.XRRQueryExtension.restype = c_bool
+        self.lib.XRRGetScreenResourcesCurrent.argtypes = [c_void_p, c_ulong]
+        self.lib.XRRGetScreenResourcesCurrent.restype = \
+            POINTER(XRRScreenResources)
+        self.lib.XRRFreeScreenResources.argtypes = [
+            POINTER(XRRScreenResources)
+        ]
+        self.lib.XRRGetOutputPrimary.argtypes = [c_void_p, c_ulong]
+        self.lib.XRRGetOutputPrimary.restype = c_ulong
+        self.lib.XRRGetOutputInfo.argtypes = [
+            c_void_p, POINTER(XRRScreenResources), c_ulong
+        ]
+        self.lib.XRRGetOutputInfo.restype = POINTER(XRROutputInfo)
+        self.lib.XRRFreeOutputInfo.argtypes = [POINTER(XRROutputInfo)]
+        self.lib.XRRGetCrtcInfo.argtypes = [
+            c_void_p, POINTER(XRRScreenResources), c_ulong
+        ]
+        self.lib.XRRGetCrtcInfo.restype = POINTER(XRRCrtcInfo)
+        self.lib.XRRFreeCrtcInfo.argtypes = [POINTER(XRRCrtcInfo)]
+
+    def is_active(self):
+        """Adapts: Bool XRRQueryExtension(Display *, int *, int *);
+
+        See: man 3 xrandr
+        """
+        assert self.xlib.dpy
+        event_base, error_base = c_int(0), c_int(0)
+        return self.lib.XRRQueryExtension(self.xlib.dpy, byref(event_base),
+                                          byref(error_base))
+
+    def query_outputs(self):
+        """Return list of OutputInfo objects describing active outputs.
+
+        Adapts XRRGetScreenResourcesCurrent, XRRGetOutputInfo and
+        XRRGetCrtcInfo; see: man 3 xrandr
+        """
+        dpy = self.xlib.dpy
+        assert dpy
+        root = self.xlib.default_root_window()
+        res = self.lib.XRRGetScreenResourcesCurrent(dpy, root)
+        if not res:
+            return []
+        primary = self.lib.XRRGetOutputPrimary(dpy, root)
+        modes = {m.id: m for m in res.contents.modes[:res.contents.nmode]}
+        outputs = []
+        for output in res.contents.outputs[:res.contents.noutput]:
+            info = self.lib.XRRGetOutputInfo(dpy, res, output)
+            if not info:
+                continue
+            crtc = None
+            if info.contents.crtc:  # output is connected and enabled
+                crtc = self.lib.XRRGetCrtcInfo(dpy, res, info.contents.crtc)
+            if crtc:
+                mode = modes.get(crtc.contents.mode)
+                outputs.append(
+                    OutputInfo(info.contents.name.decode('utf-8', 'replace'),
+                               crtc.contents.width, crtc.contents.height,
+                               crtc.contents.x, crtc.contents.y,
+                               mode_refresh_rate(mode) if mode else None,
+                               output == primary))
+                self.lib.XRRFreeCrtcInfo(crtc)
+            self.lib.XRRFreeOutputInfo(info)
+        self.lib.XRRFreeScreenResources(res)
+        return outputs
+
+
+def query_outputs(xlib):
+    """Return list of active RandR outputs or [] if RandR is unavailable."""
+    try:
+        xrandr = Xrandr(xlib)
+    except OSError:
+        return []
+    return xrandr.query_outputs() if xrandr.is_active() else []
+
+
 def query_screens():
-    """Return dict of ScreenInfo objects describing available screens."""
+    """Return dict of ScreenInfo objects describing available screens.
+
+    Refresh rate and primary flag of a screen are taken from RandR output
+    covering exactly the same area.
+    """
     xlib = Xlib()
     dpy_ptr = xlib.open_display()
     if dpy_ptr is None:
         return {}
     xinerama = Xinerama(xlib)
     all_screens = xinerama.query_screens() if xinerama.is_active() else []
+    outputs = query_outputs(xlib)
     xlib.close_display()
-    return {str(screen.number): screen for screen in all_screens}
+    screens = {}
+    for screen in all_screens:
+        area = (screen.width, screen.height, screen.x, screen.y)
+        output = next((o for o in outputs if area == o[1:5]), None)
+        if output:
+            screen = screen._replace(refresh=output.refresh,
+                                     primary=output.primary)
+        screens[str(screen.number)] = screen
+    return screens